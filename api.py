@@ -0,0 +1,154 @@
+from flask import Blueprint, request, jsonify, current_app, abort, Response, stream_with_context
+from werkzeug.exceptions import HTTPException
+from models import db, Venue, Artist
+from queries import venue_timeline, artist_timeline, show_feed
+import exporter
+from replicas import read_only
+from formatting import parse_datetime
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_FIELDS = ('id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'website',
+                'facebook_link', 'seeking_talent', 'seeking_description', 'upcoming_shows_count',
+                'past_shows_count')
+ARTIST_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link', 'website', 'facebook_link',
+                 'seeking_venue', 'seeking_description', 'upcoming_shows_count', 'past_shows_count')
+SHOW_FIELDS = ('venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time')
+TIMELINE_FIELDS = ('past_shows', 'upcoming_shows')
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+def requested_fields(allowed, default):
+    # ?fields=id,name projects the response down to the listed fields
+    fields = request.args.get('fields')
+    if not fields:
+        return default
+    fields = tuple(field.strip() for field in fields.split(',') if field.strip())
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        abort(400, 'Unknown fields: ' + ', '.join(unknown))
+    return fields
+
+
+def show_json(show):
+    return dict(show, start_time=show['start_time'].isoformat())
+
+
+def page_size():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def list_models(model, allowed):
+    # Keyset pagination on id; only the projected columns are selected.
+    fields = requested_fields(allowed, allowed)
+    columns = [getattr(model, field) for field in fields]
+    if 'id' not in fields:
+        columns.append(model.id)
+
+    limit = page_size()
+    query = db.session.query(*columns)
+    cursor = request.args.get('cursor', type=int)
+    if cursor is not None:
+        query = query.filter(model.id > cursor)
+    rows = query.order_by(model.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+
+    return jsonify({
+        'data': [{field: getattr(row, field) for field in fields} for row in rows],
+        'next_cursor': next_cursor
+    })
+
+
+def get_model(model, model_id, allowed, timeline):
+    fields = requested_fields(allowed + TIMELINE_FIELDS, allowed + TIMELINE_FIELDS)
+    columns = [getattr(model, field) for field in fields if field in allowed]
+    if 'id' not in fields:
+        columns.append(model.id)
+
+    row = db.session.query(*columns).filter(model.id == model_id).first()
+    if row is None:
+        abort(404)
+
+    data = {field: getattr(row, field) for field in fields if field in allowed}
+    if any(field in TIMELINE_FIELDS for field in fields):
+        shows = timeline(model_id)
+        data.update({field: [show_json(show) for show in shows[field]]
+                     for field in fields if field in TIMELINE_FIELDS})
+    return jsonify(data)
+
+
+@api.errorhandler(HTTPException)
+def api_error(error):
+    return jsonify({'error': error.name, 'message': error.description}), error.code
+
+
+# ----------------------------------------------------------------------------#
+# Endpoints.
+# ----------------------------------------------------------------------------#
+
+@api.route('/venues')
+@read_only
+def list_venues():
+    return list_models(Venue, VENUE_FIELDS)
+
+
+@api.route('/venues/<int:venue_id>')
+@read_only
+def get_venue(venue_id):
+    return get_model(Venue, venue_id, VENUE_FIELDS, venue_timeline)
+
+
+@api.route('/artists')
+@read_only
+def list_artists():
+    return list_models(Artist, ARTIST_FIELDS)
+
+
+@api.route('/artists/<int:artist_id>')
+@read_only
+def get_artist(artist_id):
+    return get_model(Artist, artist_id, ARTIST_FIELDS, artist_timeline)
+
+
+@api.route('/shows')
+@read_only
+def list_shows():
+    fields = requested_fields(SHOW_FIELDS, SHOW_FIELDS)
+    data, next_cursor = show_feed(request.args.get('cursor'), page_size())
+    return jsonify({
+        'data': [{field: show[field] for field in fields} for show in map(show_json, data)],
+        'next_cursor': next_cursor
+    })
+
+
+@api.route('/export/<kind>')
+@read_only
+def export_table(kind):
+    # Streams a whole table as NDJSON or CSV (?format=), optionally gzipped
+    # (?gzip=1) and limited to rows updated since a timestamp (?since=).
+    if kind not in exporter.EXPORT_COLUMNS:
+        abort(404)
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in exporter.FORMATS:
+        abort(400, 'Unknown format: ' + fmt)
+    since = request.args.get('since')
+    if since:
+        try:
+            since = parse_datetime(since)
+        except (ValueError, OverflowError):
+            abort(400, 'Invalid since: ' + since)
+    gzip = request.args.get('gzip') in ('1', 'true')
+
+    chunks = exporter.export(kind, fmt, since or None, gzip, current_app.config['STREAM_BATCH_SIZE'])
+    filename = '%s.%s%s' % (kind, fmt, '.gz' if gzip else '')
+    mimetype = 'application/gzip' if gzip else ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': 'attachment; filename=' + filename})
@@ -3,113 +3,307 @@
 # ----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-import babel
 import sys
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+import os
+import functools
+import hashlib
+import click
+from flask.cli import ScriptInfo
+from flask.globals import request_ctx
+from flask import Flask, Blueprint, render_template, request, Response, flash, redirect, url_for, jsonify, abort, \
+    session, make_response, stream_template, current_app
+from jinja2.environment import TemplateStream
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
-from flask_migrate import Migrate
-from datetime import datetime
+from formatting import format_datetime, parse_datetime
+from models import db, Show, Venue, Artist
+from queries import bump_show_counters, refresh_show_counters, venue_timeline, artist_timeline, venue_areas, \
+    iter_venue_areas, refresh_areas, refresh_area_totals, show_feed, ShowFeedStream, search, filter_criteria, facets, \
+    page_validator_query
+from typeahead import PrefixIndex
+from cache import LRUCache, PageCache, FileGenerations
+from api import api, api_error
+import instrumentation
+from instrumentation import query_budget
+import replicas
+from replicas import read_only, reads_primary, may_cache
+import exporter
+import assets
+import images
+import thumbnails
+from werkzeug.http import is_resource_modified
+from sqlalchemy import func
+from datetime import datetime, timedelta
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app, session_options={
+# The HTML pages and the commands; create_app() registers them together
+# with the extensions and the JSON API on a new app. Modules only some
+# requests or commands need (forms and WTForms, the importer, Alembic) are
+# imported where they are used, so workers boot without them.
+main = Blueprint('main', __name__, cli_group=None)
 
-    'expire_on_commit': False
 
-})
-migrate = Migrate(app, db)
+# ----------------------------------------------------------------------------#
+# Filters.
+# ----------------------------------------------------------------------------#
+
+main.add_app_template_filter(format_datetime, 'datetime')
+
+
+def buffered_stream(template_name, **context):
+    # flask.stream_template, which renders the template while iterating the
+    # generators in its context so the first bytes go out before the last
+    # rows are fetched, sent STREAM_BUFFER_SIZE pieces at a time rather than
+    # one chunk per template expression.
+    stream = TemplateStream(stream_template(template_name, **context))
+    stream.enable_buffering(current_app.config['STREAM_BUFFER_SIZE'])
+    return Response(stream, mimetype='text/html')
 
 
 # ----------------------------------------------------------------------------#
-# Models.
+# Commands.
 # ----------------------------------------------------------------------------#
 
+@main.cli.command('roll-shows')
+@click.option('--minutes', default=60, show_default=True,
+              help='Roll over shows that started within this many minutes.')
+@click.option('--all', 'full', is_flag=True, help='Recount every venue and artist.')
+def roll_shows(minutes, full):
+    """Move started shows from the upcoming to the past counters."""
+    since = None if full else datetime.utcnow() - timedelta(minutes=minutes)
+    venues_updated = refresh_show_counters(Venue, Show.venue_id, since)
+    artists_updated = refresh_show_counters(Artist, Show.artist_id, since)
+    areas_updated = refresh_area_totals()
+    db.session.commit()
+    click.echo('Updated %d venues, %d artists and %d areas.' % (venues_updated, artists_updated, areas_updated))
+
+
+@main.cli.command('refresh-areas')
+def refresh_areas_command():
+    """Rebuild the city/state area summary behind /venues."""
+    refresh_areas()
+    db.session.commit()
+    click.echo('Refreshed areas.')
+
+
+@main.cli.command('import')
+@click.argument('kind', type=click.Choice(['artists', 'shows', 'venues']))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows validated and loaded per transaction.')
+@click.option('--method', type=click.Choice(['copy', 'executemany']), default='copy', show_default=True)
+def import_data(kind, source, fmt, batch_size, method):
+    """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+    import importer
+    fmt = fmt or ('ndjson' if source.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+    def on_reject(line, errors):
+        click.echo('row %d rejected: %s' % (line, '; '.join(errors)), err=True)
+
+    loaded, rejected, seconds = importer.import_rows(kind, importer.read_rows(source, fmt),
+                                                     batch_size=batch_size, method=method, on_reject=on_reject)
+    if loaded:
+        # What the submission handlers invalidate; the generations are files
+        # shared with the running workers, so this reaches them too.
+        if kind == 'venues':
+            page_cache.invalidate('main.venues')
+            facet_cache.invalidate('venues')
+        elif kind == 'artists':
+            page_cache.invalidate('main.artists')
+            facet_cache.invalidate('artists')
+        else:
+            page_cache.invalidate('main.shows', 'main.venues')
+    click.echo('Loaded %d %s, rejected %d in %.1fs (%.0f rows/s).'
+               % (loaded, kind, rejected, seconds, (loaded + rejected) / seconds if seconds else 0))
+
+
+@main.cli.command('build-assets')
+def build_assets():
+    """Bundle, fingerprint and precompress the static CSS and JS and resize the images."""
+    built = assets.build(current_app.static_folder, current_app.static_url_path)
+    for name, (path, sizes) in sorted(built.items()):
+        click.echo('%-16s -> %s  %s' % (name, path, '  '.join(
+            '%s %.1f kB' % (variant, size / 1024.0) for variant, size in sorted(sizes.items()))))
+    if assets.brotli is None:
+        click.echo('brotli is not installed; only gzip variants were written.')
+
+    if images.Image is None:
+        click.echo('Pillow is not installed; images are served as they are.')
+        return
+    for name, image in sorted(assets.build_images(current_app.static_folder).items()):
+        click.echo('%-16s -> %s' % (name, '  '.join(
+            '%s %s' % (fmt, ','.join(str(width) for width, path in variants))
+            for fmt, mimetype, variants in image['sources'])))
+
+
+@main.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(exporter.EXPORT_COLUMNS)))
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='Output file; stdout by default.')
+@click.option('--format', 'fmt', type=click.Choice(exporter.FORMATS), default='ndjson', show_default=True)
+@click.option('--since', type=click.DateTime(), help='Only rows created or updated since this UTC time.')
+@click.option('--gzip', is_flag=True, help='Gzip the output.')
+def export_data(kind, output, fmt, since, gzip):
+    """Stream a table as NDJSON or CSV."""
+    for chunk in exporter.export(kind, fmt, since, gzip, current_app.config['STREAM_BATCH_SIZE']):
+        output.write(chunk)
 
-class Show(db.Model):
-    __tablename__ = 'shows'
 
-    id = db.Column(db.Integer, primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+# ----------------------------------------------------------------------------#
+# Typeahead.
+# ----------------------------------------------------------------------------#
+
+venue_index = PrefixIndex()
+artist_index = PrefixIndex()
 
-    def __repr__(self):
-        return f'<Show {self.id} {self.start_time}>'
 
+def index_version(model):
+    # Changes when a row is added, edited or deleted.
+    return tuple(db.session.query(func.count(model.id), func.max(model.updated_at)).one())
 
-class Venue(db.Model):
-    __tablename__ = 'venues'
 
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    address = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
-    image_link = db.Column(db.String(500))
-    website = db.Column(db.String(120))
-    facebook_link = db.Column(db.String(120))
-    seeking_talent = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(500))
-    shows = db.relationship('Show', backref='venue', lazy=True)
+def load_index(index, model):
+    version = index_version(model)
+    if version != index.version:
+        index.load(db.session.query(model.id, model.name).all(), version)
 
-    def __repr__(self):
-        return f'<Venue {self.id} {self.name}>'
 
+def autocomplete(index, model):
+    # The index is filled from the database on first use in each worker.
+    # The create/edit submission handlers update it right away in the
+    # worker that handled them; every other worker compares the index's
+    # version with the table every TYPEAHEAD_RELOAD_INTERVAL seconds and
+    # reloads it when they differ: two queries at most, none in between.
+    if index.due(current_app.config['TYPEAHEAD_RELOAD_INTERVAL']):
+        try:
+            load_index(index, model)
+        finally:
+            index.checked()
+    limit = min(request.args.get('limit', current_app.config['TYPEAHEAD_LIMIT'], type=int), 50)
+    return jsonify(index.complete(request.args.get('q', ''), limit))
 
-class Artist(db.Model):
-    __tablename__ = 'artists'
 
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
-    image_link = db.Column(db.String(500))
-    website = db.Column(db.String(120))
-    facebook_link = db.Column(db.String(120))
-    seeking_venue = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(500))
-    shows = db.relationship('Show', backref='artist', lazy=True)
+# ----------------------------------------------------------------------------#
+# Page cache.
+# ----------------------------------------------------------------------------#
 
-    def __repr__(self):
-        return f'<Artist {self.id} {self.name}>'
+# Sized from PAGE_CACHE_SIZE/PAGE_CACHE_TTL by create_app().
+page_cache = PageCache(LRUCache())
+
+
+def cached_page(view):
+    # Serves the rendered body of a listing page from the page cache. The
+    # TTL bounds how long the upcoming/past split can lag behind the clock.
+    # Submission handlers invalidate the endpoints they affect right away
+    # for every worker on the host (the generations are files under
+    # CACHE_GENERATIONS_DIR); on other hosts the TTL is the bound.
+    # Clients reading from the primary after a write skip the cache, and
+    # pages read from a replica right after an invalidation are not stored.
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if '_flashes' in session or reads_primary():
+            return view(*args, **kwargs)
+
+        key = page_cache.key(request.endpoint, request.full_path)
+        body = page_cache.get(key)
+        if body is None:
+            rv = view(*args, **kwargs)
+            if not isinstance(rv, str):
+                return rv
+            body = rv.encode('utf-8')
+            if may_cache(page_cache.invalidated_at(request.endpoint)):
+                page_cache.set(key, body)
+        return Response(body, mimetype='text/html')
+    return wrapper
 
 
 # ----------------------------------------------------------------------------#
-# Filters.
+# Facets.
+# ----------------------------------------------------------------------------#
+
+# Sized from FACET_CACHE_SIZE/FACET_CACHE_TTL by create_app().
+facet_cache = PageCache(LRUCache())
+
+
+def listing_filters():
+    # ?genre= (repeatable, every genre must match), ?city= and ?state=; read
+    # from the form too, so the search pages can post them along.
+    return {
+        'genre': sorted(set(request.values.getlist('genre'))),
+        'city': request.values.get('city') or None,
+        'state': request.values.get('state') or None
+    }
+
+
+def facet_key(model, filters, term=None):
+    return facet_cache.key(model.__tablename__, json.dumps([filters, term], sort_keys=True))
+
+
+def cached_facets(model, filters, term=None):
+    # Facet counts only change when a venue or artist is created or edited,
+    # and those handlers invalidate them, the same way as cached_page.
+    if reads_primary():
+        return facets(model, filters, term)
+    key = facet_key(model, filters, term)
+    data = facet_cache.get(key)
+    if data is None:
+        data = facets(model, filters, term)
+        if may_cache(facet_cache.invalidated_at(model.__tablename__)):
+            facet_cache.set(key, data)
+    return data
+
+
+# ----------------------------------------------------------------------------#
+# Conditional GET.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+def validator(subject_id, subject_updated_at, row):
+    # ETag and Last-Modified of a detail page from its page_validator_query row.
+    last_modified = max(t for t in (subject_updated_at, row.updated_at, row.last_started) if t is not None)
+    etag = hashlib.sha1(('%s:%s:%d' % (subject_id, last_modified.isoformat(), row.show_count)).encode()).hexdigest()
+    return etag, last_modified
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+def page_validator(subject, subject_column, counterpart, counterpart_column):
+    row = page_validator_query(subject_column, subject.id, counterpart, counterpart_column).one()
+    return validator(subject.id, subject.updated_at, row)
+
+
+def personalized():
+    # Whether the page shows this client's flashed messages, whether the
+    # render already took them from the session or they are still there.
+    return bool(request_ctx.flashes) or '_flashes' in session
+
+
+def not_modified(etag, last_modified):
+    if personalized():
+        return False
+    return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+
+def conditional_response(body, etag, last_modified, status=200):
+    # A page with flashed messages must not be kept by a shared cache and
+    # then revalidated for other clients, so it gets no validators.
+    response = make_response(body, status)
+    if personalized():
+        response.cache_control.private = True
+        response.cache_control.no_store = True
+        return response
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
 
 
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
-@app.route('/')
+@main.route('/')
 def index():
     return render_template('pages/home.html')
 
@@ -117,66 +311,53 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
-def venues():
 
-    data = []
-    all_venues = Venue.query.order_by(Venue.city, Venue.state).all()
-
-    oldCity = ''
-    i = -1
-    for venue in all_venues:
-        if venue.city != oldCity:
-            i += 1
-            oldCity = venue.city
-            data.append({
-                "city": venue.city,
-                "state": venue.state,
-                "venues": [{
-                    "id": venue.id,
-                    "name": venue.name,
-                    "num_upcoming_shows": Show.query.filter(Show.venue_id == venue.id).filter(
-                        Show.start_time >= datetime.utcnow()).count()
-                }]
-            })
-        else:
-            data[i]['venues'].append({
-                "id": venue.id,
-                "name": venue.name,
-                "num_upcoming_shows": Show.query.filter(Show.venue_id == venue.id).filter(
-                    Show.start_time >= datetime.utcnow()).count()
-            })
-
-    return render_template('pages/venues.html', areas=data)
+@main.route('/venues')
+@query_budget(2)
+@read_only
+@cached_page
+def venues():
+    filters = listing_filters()
+    venue_facets = cached_facets(Venue, filters)
+    if current_app.config['STREAM_LISTING_PAGES']:
+        return buffered_stream('pages/venues.html', areas=iter_venue_areas(filters), facets=venue_facets,
+                               filters=filters)
+    return render_template('pages/venues.html', areas=venue_areas(filters), facets=venue_facets, filters=filters)
 
 
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues/search', methods=['POST'])
+@query_budget(2)
+@read_only
 def search_venues():
-    body = {}
-    data = []
-    count = 0
+    search_term = request.form.get('search_term', '')
+    filters = listing_filters()
+    data = [{
+        'id': venue.id,
+        'name': venue.name,
+        'num_upcoming_shows': venue.num_upcoming_shows
+    } for venue in search(Venue, search_term, filters)]
 
-    name = request.form.get('search_term')
+    body = {'count': len(data), 'data': data}
+    return render_template('pages/search_venues.html', results=body, search_term=search_term,
+                           facets=cached_facets(Venue, filters, search_term), filters=filters)
 
-    venue_results = Venue.query.filter(Venue.name.ilike('%' + name + '%')).all()
 
-    for venue in venue_results:
-        count += 1
-        dataToAdd = {}
-        dataToAdd['id'] = venue.id
-        dataToAdd['name'] = venue.name
-        dataToAdd['num_upcoming_shows'] = Show.query.filter(Show.venue_id == venue.id).filter(
-            Show.start_time >= datetime.utcnow()).count()
-        data.append(dataToAdd)
+@main.route('/venues/autocomplete')
+@query_budget(2)
+@read_only
+def autocomplete_venues():
+    return autocomplete(venue_index, Venue)
 
-    body['count'] = count
-    body['data'] = data
-    return render_template('pages/search_venues.html', results=body, search_term=request.form.get('search_term', ''))
 
-
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
+@query_budget(3)
+@read_only
 def show_venue(venue_id):
-    dataReceived = Venue.query.get(venue_id)
+    dataReceived = Venue.query.get_or_404(venue_id)
+
+    etag, last_modified = page_validator(dataReceived, Show.venue_id, Artist, Show.artist_id)
+    if not_modified(etag, last_modified):
+        return conditional_response('', etag, last_modified, 304)
 
     venue_data = {
         'id': dataReceived.id,
@@ -193,46 +374,22 @@ def show_venue(venue_id):
         'seeking_description': dataReceived.seeking_description
     }
 
-    past_shows = Show.query.filter(Show.venue_id == dataReceived.id).filter(
-        Show.start_time <= datetime.utcnow()).all()
-    venue_data['past_shows'] = []
-    for show in past_shows:
-        venue_data['past_shows'].append({
-            'artist_id': show.artist_id,
-            'artist_name': show.artist.name,
-            'artist_image_link': show.artist.image_link,
-            'start_time': str(show.start_time),
-        })
-
-    upcoming_shows = Show.query.filter(Show.venue_id == venue_data['id']).filter(
-        Show.start_time >= datetime.utcnow()).all()
-    venue_data['upcoming_shows'] = []
-    for show in upcoming_shows:
-        venue_data['upcoming_shows'].append({
-            'artist_id': show.artist_id,
-            'artist_name': show.artist.name,
-            'artist_image_link': show.artist.image_link,
-            'start_time': str(show.start_time),
-        })
-
-    venue_data['past_shows_count'] = Show.query.filter(Show.venue_id == venue_data['id']).filter(
-        Show.start_time <= datetime.utcnow()).count()
-    venue_data['upcoming_shows_count'] = Show.query.filter(Show.venue_id == venue_data['id']).filter(
-        Show.start_time >= datetime.utcnow()).count()
-
-    return render_template('pages/show_venue.html', venue=venue_data)
+    venue_data.update(venue_timeline(dataReceived.id))
+
+    return conditional_response(render_template('pages/show_venue.html', venue=venue_data), etag, last_modified)
 
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
+    from forms import VenueForm
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
 
     error = False
@@ -247,7 +404,11 @@ def create_venue_submission():
                           facebook_link=request.form['facebook_link'])
 
         db.session.add(new_venue)
+        refresh_areas([(new_venue.city, new_venue.state)])
         db.session.commit()
+        venue_index.add(new_venue.id, new_venue.name)
+        page_cache.invalidate('main.venues')
+        facet_cache.invalidate('venues')
     except:
         db.session.rollback()
         error = True
@@ -265,7 +426,7 @@ def create_venue_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@main.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     error = False
     # try:
@@ -293,37 +454,50 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@main.route('/artists')
+@query_budget(2)
+@read_only
+@cached_page
 def artists():
-    return render_template('pages/artists.html', artists=Artist.query.all())
+    filters = listing_filters()
+    return render_template('pages/artists.html',
+                           artists=Artist.query.filter(*filter_criteria(Artist, filters)).all(),
+                           facets=cached_facets(Artist, filters), filters=filters)
 
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
+@query_budget(2)
+@read_only
 def search_artists():
-    body = {}
-    data = []
-    count = 0
+    search_term = request.form.get('search_term', '')
+    filters = listing_filters()
+    data = [{
+        'id': artist.id,
+        'name': artist.name,
+        'num_upcoming_shows': artist.num_upcoming_shows
+    } for artist in search(Artist, search_term, filters)]
 
-    name = request.form.get('search_term')
-    artist_results = Artist.query.filter(Artist.name.ilike('%' + name + '%')).all()
+    body = {'count': len(data), 'data': data}
+    return render_template('pages/search_artists.html', results=body, search_term=search_term,
+                           facets=cached_facets(Artist, filters, search_term), filters=filters)
 
-    for artist in artist_results:
-        count += 1
-        dataToAdd = {}
-        dataToAdd['id'] = artist.id
-        dataToAdd['name'] = artist.name
-        dataToAdd['num_upcoming_shows'] = 0
-        data.append(dataToAdd)
 
-    body['count'] = count
-    body['data'] = data
+@main.route('/artists/autocomplete')
+@query_budget(2)
+@read_only
+def autocomplete_artists():
+    return autocomplete(artist_index, Artist)
 
-    return render_template('pages/search_artists.html', results=body, search_term=request.form.get('search_term', ''))
 
-
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
+@query_budget(3)
+@read_only
 def show_artist(artist_id):
-    dataReceived = Artist.query.get(artist_id)
+    dataReceived = Artist.query.get_or_404(artist_id)
+
+    etag, last_modified = page_validator(dataReceived, Show.artist_id, Venue, Show.venue_id)
+    if not_modified(etag, last_modified):
+        return conditional_response('', etag, last_modified, 304)
 
     artist_data = {
         'id': dataReceived.id,
@@ -339,40 +513,16 @@ def show_artist(artist_id):
         'seeking_description': dataReceived.seeking_description
     }
 
-    past_shows = Show.query.filter(Show.artist_id == artist_data['id']).filter(
-        Show.start_time <= datetime.utcnow()).all()
-    artist_data['past_shows'] = []
-    for show in past_shows:
-        artist_data['past_shows'].append({
-            'venue_id': show.venue_id,
-            'venue_name': show.venue.name,
-            'venue_image_link': show.venue.image_link,
-            'start_time': str(show.start_time),
-        })
-
-    upcoming_shows = Show.query.filter(Show.artist_id == artist_data['id']).filter(
-        Show.start_time >= datetime.utcnow()).all()
-    artist_data['upcoming_shows'] = []
-    for show in upcoming_shows:
-        artist_data['upcoming_shows'].append({
-            'venue_id': show.venue_id,
-            'venue_name': show.venue.name,
-            'venue_image_link': show.venue.image_link,
-            'start_time': str(show.start_time),
-        })
-
-    artist_data['past_shows_count'] = Show.query.filter(Show.artist_id == artist_data['id']).filter(
-        Show.start_time <= datetime.utcnow()).count()
-    artist_data['upcoming_shows_count'] = Show.query.filter(Show.artist_id == artist_data['id']).filter(
-        Show.start_time >= datetime.utcnow()).count()
-
-    return render_template('pages/show_artist.html', artist=artist_data)
+    artist_data.update(artist_timeline(dataReceived.id))
+
+    return conditional_response(render_template('pages/show_artist.html', artist=artist_data), etag, last_modified)
 
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+    from forms import ArtistForm
 
     artist = Artist.query.filter_by(id=artist_id).first_or_404()
     form = ArtistForm(obj=artist)
@@ -380,7 +530,7 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
 
     error = False
@@ -393,6 +543,9 @@ def edit_artist_submission(artist_id):
         artist_to_update.genres = request.form.getlist('genres')
         artist_to_update.facebook_link = request.form['facebook_link']
         db.session.commit()
+        artist_index.add(artist_to_update.id, artist_to_update.name)
+        page_cache.invalidate('main.artists', 'main.shows')
+        facet_cache.invalidate('artists')
     except:
         db.session.rollback()
         error = True
@@ -404,11 +557,12 @@ def edit_artist_submission(artist_id):
     else:
         flash('Venue ' + artist_to_update.name + ' was successfully Updated!')
 
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    return redirect(url_for('main.show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+    from forms import VenueForm
 
     venue = Venue.query.filter_by(id=venue_id).first_or_404()
     form = VenueForm(obj=venue)
@@ -416,12 +570,13 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
 
     error = False
     try:
         venue_to_update = Venue.query.get(venue_id)
+        old_area = (venue_to_update.city, venue_to_update.state)
         venue_to_update.name = request.form['name']
         venue_to_update.city = request.form['city']
         venue_to_update.state = request.form['state']
@@ -429,7 +584,11 @@ def edit_venue_submission(venue_id):
         venue_to_update.phone = request.form['phone']
         venue_to_update.genres = request.form.getlist('genres')
         venue_to_update.facebook_link = request.form['facebook_link']
+        refresh_areas([old_area, (venue_to_update.city, venue_to_update.state)])
         db.session.commit()
+        venue_index.add(venue_to_update.id, venue_to_update.name)
+        page_cache.invalidate('main.venues', 'main.shows')
+        facet_cache.invalidate('venues')
     except:
         db.session.rollback()
         error = True
@@ -441,19 +600,20 @@ def edit_venue_submission(venue_id):
     else:
         flash('Venue ' + venue_to_update.name + ' was successfully Updated!')
 
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
+    from forms import ArtistForm
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     error = False
 
@@ -467,6 +627,9 @@ def create_artist_submission():
 
         db.session.add(new_artist)
         db.session.commit()
+        artist_index.add(new_artist.id, new_artist.name)
+        page_cache.invalidate('main.artists')
+        facet_cache.invalidate('artists')
     except:
         db.session.rollback()
         error = True
@@ -487,46 +650,41 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+
+@main.route('/shows')
+@query_budget(1)
+@read_only
+@cached_page
 def shows():
     # displays list of shows at /shows
+    if current_app.config['STREAM_LISTING_PAGES']:
+        return buffered_stream('pages/shows.html', shows=ShowFeedStream(request.args.get('after')))
+    data, next_cursor = show_feed(request.args.get('after'))
+    return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
 
-    data = []
-    shows = Show.query.all()
-
-    for show in shows:
-        artObj = {
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": str(show.start_time)
-        }
-        data.append(artObj)
-
-    return render_template('pages/shows.html', shows=data)
 
-
-@app.route('/shows/create')
+@main.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
+    from forms import ShowForm
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
 
     error = False
 
     try:
-        new_show = Show(artist_id=request.form['artist_id'],
-                        venue_id=request.form['venue_id'],
-                        start_time=request.form['start_time'])
+        new_show = Show(artist_id=int(request.form['artist_id']),
+                        venue_id=int(request.form['venue_id']),
+                        start_time=parse_datetime(request.form['start_time']))
 
         db.session.add(new_show)
+        bump_show_counters(new_show.venue_id, new_show.artist_id, new_show.start_time)
         db.session.commit()
+        page_cache.invalidate('main.shows', 'main.venues')
     except:
         db.session.rollback()
         error = True
@@ -544,25 +702,98 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def not_found_error(error):
+    # Flask tries handlers registered for the status code before those for
+    # an exception class, so this one would otherwise beat the API's
+    # HTTPException handler and send its 404s as HTML.
+    if request.blueprint == api.name:
+        return api_error(error)
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+# ----------------------------------------------------------------------------#
+# App factory.
+# ----------------------------------------------------------------------------#
+
+def create_app(config='config', production=False):
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if not app.config['SECRET_KEY']:
+        if production:
+            raise RuntimeError('SECRET_KEY is not set; every server process needs the same one')
+        app.config['SECRET_KEY'] = os.urandom(32)
+    for cache, prefix in ((page_cache, 'PAGE_CACHE'), (facet_cache, 'FACET_CACHE')):
+        cache.backend.maxsize = app.config[prefix + '_SIZE']
+        cache.ttl = app.config[prefix + '_TTL']
+        cache.generations = FileGenerations(os.path.join(app.config['CACHE_GENERATIONS_DIR'], prefix.lower()))
+
+    db.init_app(app)
+    if loaded_by_flask_cli():
+        # Alembic is the slowest import of all and only `flask db` needs it.
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    replicas.init_app(app)
+    assets.init_app(app)
+    thumbnails.init_app(app)
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+    if app.config['SQL_INSTRUMENTATION']:
+        instrumentation.init_app(app)
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+
+    if app.config['SQL_INSTRUMENTATION'] and not instrumentation.logger.handlers:
+        sql_handler = FileHandler('sql.log')
+        sql_handler.setFormatter(Formatter('%(asctime)s %(levelname)s: %(message)s'))
+        instrumentation.logger.setLevel(logging.INFO)
+        instrumentation.logger.addHandler(sql_handler)
+
+    return app
+
+
+def loaded_by_flask_cli():
+    # True when the flask command is loading the app to run one of its
+    # commands, False under a server (even one started from a click CLI).
+    ctx = click.get_current_context(silent=True)
+    return ctx is not None and ctx.find_object(ScriptInfo) is not None
+
+
+def warm_up(app):
+    # Fills the per-process state the first requests would otherwise pay
+    # for: typeahead indexes, compiled templates and date patterns. Run it
+    # in the server's master process before forking so workers share the
+    # result, then dispose of the engines (see gunicorn.conf.py).
+    with app.app_context():
+        load_index(venue_index, Venue)
+        load_index(artist_index, Artist)
+        db.session.remove()
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+    for format in ('full', 'medium'):
+        format_datetime(datetime.utcnow(), format)
+
+
+def dispose_engines(app, close=True):
+    # close=False in a forked worker: the parent's connections are dropped
+    # from the pool without being closed, so they stay usable by the parent.
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
 
 # ----------------------------------------------------------------------------#
 # Launch.
@@ -570,11 +801,16 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    if '--profile-startup' in sys.argv:
+        # Where a worker's boot time goes; see startup.py.
+        import startup
+        startup.main(sys.argv[1:])
+    else:
+        create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
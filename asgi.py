@@ -0,0 +1,273 @@
+# ----------------------------------------------------------------------------#
+# Async read path.
+#
+# The read-only pages (venue, artist and show listings, details and
+# searches) served from an ASGI app on an asyncpg engine, so a worker keeps
+# serving other requests while one waits on Postgres:
+#
+#     uvicorn asgi:app --workers 4
+#
+# Queries come from the same builders in queries.py and pages are rendered
+# by the Flask app's Jinja environment inside a Flask request context, so
+# templates, filters, url_for and flashed messages behave as under WSGI.
+# Every other route (forms, submissions, the JSON API, static files) is
+# passed through to the Flask app.
+# ----------------------------------------------------------------------------#
+
+import asyncio
+import contextlib
+import functools
+from a2wsgi import WSGIMiddleware
+from flask import g, render_template, abort, request as flask_request, session as flask_session
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route, Mount
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from app import create_app, page_cache, facet_cache, facet_key, listing_filters, validator, not_modified, \
+    conditional_response
+from replicas import reads_primary, may_cache
+from api import VENUE_FIELDS, ARTIST_FIELDS
+from models import Show, Venue, Artist
+from queries import areas_query, area_data, show_timeline_query, split_timeline, show_feed_query, show_feed_page, \
+    search_results_query, facets_query, facet_data, filter_criteria, page_validator_query
+
+
+flask_app = create_app(production=True)
+
+
+def async_url(uri):
+    return make_url(uri).set(drivername='postgresql+asyncpg')
+
+
+def async_database_uri(config):
+    return async_url(config['ASYNC_DATABASE_URI'] or config['SQLALCHEMY_DATABASE_URI'])
+
+
+engine = create_async_engine(async_database_uri(flask_app.config),
+                             pool_size=flask_app.config['ASYNC_POOL_SIZE'],
+                             max_overflow=flask_app.config['ASYNC_MAX_OVERFLOW'])
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+# The replicas of the Flask app's SQLALCHEMY_BINDS, with the same
+# timeouts in asyncpg's terms.
+replica_engines = dict(
+    (key, create_async_engine(async_url(bind['url']),
+                              pool_size=flask_app.config['ASYNC_POOL_SIZE'],
+                              max_overflow=flask_app.config['ASYNC_MAX_OVERFLOW'],
+                              connect_args={
+                                  'timeout': flask_app.config['REPLICA_CONNECT_TIMEOUT'],
+                                  'server_settings': {
+                                      'statement_timeout': str(flask_app.config['REPLICA_STATEMENT_TIMEOUT'])
+                                  }
+                              }))
+    for key, bind in (flask_app.config['SQLALCHEMY_BINDS'] or {}).items() if key.startswith('replica')
+)
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+def flask_view(handler):
+    # Runs the handler with an AsyncSession inside a Flask request context
+    # that mirrors the ASGI request (URL, headers, form). The form is passed
+    # decoded, so the builder sets its own content type and length.
+    # Flask keeps its contexts in contextvars, which asyncio gives every
+    # task its own copy of, so concurrent requests do not see each other's.
+    @functools.wraps(handler)
+    async def endpoint(request):
+        form = await request.form() if request.method == 'POST' else None
+        context = flask_app.test_request_context(
+            request.url.path,
+            base_url=str(request.base_url),
+            method=request.method,
+            query_string=request.url.query,
+            headers=[(name, value) for name, value in request.headers.items()
+                     if name not in ('content-type', 'content-length')],
+            data=MultiDict(form.multi_items()) if form is not None else None
+        )
+        with context:
+            try:
+                g.db_replica = await pick_replica()
+                async with Session(bind=replica_engines[g.db_replica] if g.db_replica else engine) as session:
+                    return await handler(request, session)
+            except HTTPException as error:
+                if error.code == 404:
+                    return html(render_template('errors/404.html'), 404)
+                return Response(error.get_body(), status_code=error.code, media_type='text/html')
+    return endpoint
+
+
+async def pick_replica():
+    # The replica replicas._route would pick, from the lag figures the Flask
+    # app keeps. Measuring lag runs blocking queries, so a due check runs in
+    # a thread. These views never write, so there is nothing to _stick.
+    replica_set = flask_app.extensions.get('replicas')
+    if replica_set is None or reads_primary():
+        return None
+    engines = flask_app.extensions['sqlalchemy'].engines
+    if replica_set.due():
+        return await asyncio.to_thread(replica_set.pick, engines)
+    return replica_set.pick(engines)
+
+
+def send(response):
+    # A Flask response as a Starlette one. Saves the Flask session too, so
+    # flashed messages shown on this page are not shown again.
+    flask_app.session_interface.save_session(flask_app, flask_session._get_current_object(), response)
+    return Response(response.get_data(), status_code=response.status_code, headers=dict(response.headers))
+
+
+def html(body, status=200):
+    return send(flask_app.make_response((body, status)))
+
+
+async def fetch(session, query):
+    return (await session.execute(query.statement)).all()
+
+
+async def cached_page(render):
+    # Same keys as app.cached_page, so both paths share entries.
+    if '_flashes' in flask_session or reads_primary():
+        return html(await render())
+
+    key = page_cache.key(flask_request.endpoint, flask_request.full_path)
+    body = page_cache.get(key)
+    if body is None:
+        body = (await render()).encode('utf-8')
+        if may_cache(page_cache.invalidated_at(flask_request.endpoint)):
+            page_cache.set(key, body)
+    return html(body)
+
+
+async def cached_facets(session, model, filters, term=None):
+    if reads_primary():
+        return facet_data((await session.execute(facets_query(model, filters, term).statement)).one())
+    key = facet_key(model, filters, term)
+    data = facet_cache.get(key)
+    if data is None:
+        data = facet_data((await session.execute(facets_query(model, filters, term).statement)).one())
+        if may_cache(facet_cache.invalidated_at(model.__tablename__)):
+            facet_cache.set(key, data)
+    return data
+
+
+async def detail_page(session, model, fields, subject_id, timeline, template, name):
+    # Answers conditional requests with the same validators as app.py.
+    row = (await session.execute(
+        select(model.updated_at, *[getattr(model, field) for field in fields]).where(model.id == subject_id)
+    )).first()
+    if row is None:
+        abort(404)
+
+    subject_column, counterpart, counterpart_column, prefix = timeline
+    etag, last_modified = validator(subject_id, row.updated_at, (await session.execute(
+        page_validator_query(subject_column, subject_id, counterpart, counterpart_column).statement
+    )).one())
+    if not_modified(etag, last_modified):
+        return send(conditional_response('', etag, last_modified, 304))
+
+    data = dict((field, getattr(row, field)) for field in fields)
+    data.update(split_timeline(
+        await fetch(session, show_timeline_query(subject_column, subject_id, counterpart, counterpart_column)),
+        prefix
+    ))
+    return send(conditional_response(render_template(template, **{name: data}), etag, last_modified))
+
+
+async def search_page(session, model, template):
+    search_term = flask_request.form.get('search_term', '')
+    filters = listing_filters()
+    data = [{
+        'id': row.id,
+        'name': row.name,
+        'num_upcoming_shows': row.num_upcoming_shows
+    } for row in await fetch(session, search_results_query(model, search_term, filters))]
+
+    body = {'count': len(data), 'data': data}
+    return html(render_template(template, results=body, search_term=search_term,
+                                facets=await cached_facets(session, model, filters, search_term), filters=filters))
+
+
+# ----------------------------------------------------------------------------#
+# Controllers.
+# ----------------------------------------------------------------------------#
+
+@flask_view
+async def venues(request, session):
+    async def render():
+        filters = listing_filters()
+        areas = [area_data(row) for row in await fetch(session, areas_query(filters))]
+        return render_template('pages/venues.html', areas=areas,
+                               facets=await cached_facets(session, Venue, filters), filters=filters)
+    return await cached_page(render)
+
+
+@flask_view
+async def search_venues(request, session):
+    return await search_page(session, Venue, 'pages/search_venues.html')
+
+
+@flask_view
+async def show_venue(request, session):
+    return await detail_page(session, Venue, VENUE_FIELDS, request.path_params['venue_id'],
+                             (Show.venue_id, Artist, Show.artist_id, 'artist'), 'pages/show_venue.html', 'venue')
+
+
+@flask_view
+async def artists(request, session):
+    async def render():
+        filters = listing_filters()
+        rows = (await session.execute(
+            select(Artist.id, Artist.name).where(*filter_criteria(Artist, filters))
+        )).all()
+        return render_template('pages/artists.html', artists=rows,
+                               facets=await cached_facets(session, Artist, filters), filters=filters)
+    return await cached_page(render)
+
+
+@flask_view
+async def search_artists(request, session):
+    return await search_page(session, Artist, 'pages/search_artists.html')
+
+
+@flask_view
+async def show_artist(request, session):
+    return await detail_page(session, Artist, ARTIST_FIELDS, request.path_params['artist_id'],
+                             (Show.artist_id, Venue, Show.venue_id, 'venue'), 'pages/show_artist.html', 'artist')
+
+
+@flask_view
+async def shows(request, session):
+    async def render():
+        per_page = flask_app.config['SHOWS_PER_PAGE']
+        query = show_feed_query(flask_request.args.get('after')).limit(per_page + 1)
+        data, next_cursor = show_feed_page(await fetch(session, query), per_page)
+        return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
+    return await cached_page(render)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    for each in [engine] + list(replica_engines.values()):
+        await each.dispose()
+
+
+app = Starlette(
+    routes=[
+        Route('/venues', venues),
+        Route('/venues/search', search_venues, methods=['POST']),
+        Route('/venues/{venue_id:int}', show_venue),
+        Route('/artists', artists),
+        Route('/artists/search', search_artists, methods=['POST']),
+        Route('/artists/{artist_id:int}', show_artist),
+        Route('/shows', shows),
+        Mount('/', WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan
+)
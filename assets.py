@@ -0,0 +1,212 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from flask import current_app, request, send_from_directory, url_for, abort
+import images
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bundles the layouts load, each built from its files in this order. The
+# head bundle blocks rendering, so it only holds what must run first.
+BUNDLES = {
+    'css/app.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css', 'css/main.responsive.css',
+                    'css/main.quickfix.css'],
+    'js/head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    'js/app.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+# Files the layouts load on their own (the IE shim and the jQuery fallback).
+FILES = ['js/libs/respond-1.4.2.min.js', 'js/libs/jquery-1.11.1.min.js']
+# Images served as resized variants, and the widths (in CSS pixels times
+# 1 and 2) they are shown at.
+IMAGES = {
+    'img/front-splash.jpg': (480, 720, 960, 1440),
+}
+
+# Build output and its manifest, relative to the static folder.
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+IMAGE_MANIFEST = 'images.json'
+COMPRESSED = ('.css', '.js', '.svg', '.json')
+
+# License comments (/*! ... */) are kept.
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+CSS_SPACE = re.compile(r'\s*([{};,>])\s*')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+SOURCE_MAP = re.compile(r'^//[#@] sourceMappingURL=.*$', re.M)
+
+
+# ----------------------------------------------------------------------------#
+# Build.
+# ----------------------------------------------------------------------------#
+
+def minify_css(text):
+    text = CSS_COMMENT.sub('', text)
+    text = CSS_SPACE.sub(r'\1', ' '.join(text.split()))
+    return text.replace(';}', '}')
+
+
+def minify_js(text):
+    # Whole-line comments, indentation and blank lines only, which is safe
+    # without parsing; the libraries are shipped minified already.
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def rebase_css_urls(text, name, static_url_path):
+    # The bundle lives in another directory than its sources, so relative
+    # url()s are rewritten to absolute paths under the static URL.
+    def rebase(match):
+        url = match.group(2)
+        if url.startswith(('/', 'data:', 'http:', 'https:', '#')):
+            return match.group(0)
+        return 'url("%s/%s")' % (static_url_path, posixpath.normpath(posixpath.join(posixpath.dirname(name), url)))
+    return CSS_URL.sub(rebase, text)
+
+
+def read_source(static_folder, name, static_url_path):
+    with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+        text = f.read()
+    if name.endswith('.css'):
+        return minify_css(rebase_css_urls(text, name, static_url_path))
+    text = SOURCE_MAP.sub('', text)
+    return text.strip() if name.endswith('.min.js') else minify_js(text)
+
+
+def fingerprinted(name, data):
+    root, ext = posixpath.splitext(name)
+    return '%s/%s.%s%s' % (DIST, root, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def write_asset(static_folder, path, data):
+    # Writes the file with its .gz and .br variants; returns the sizes.
+    target = os.path.join(static_folder, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    variants = [('', data)]
+    if path.endswith(COMPRESSED):
+        variants.append(('.gz', gzip.compress(data, 9, mtime=0)))
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, content in variants:
+        with open(target + suffix, 'wb') as f:
+            f.write(content)
+    return dict((suffix or 'raw', len(content)) for suffix, content in variants)
+
+
+def build(static_folder, static_url_path):
+    # Bundles and minifies BUNDLES, copies FILES, names every output after
+    # its content hash and records the names in the manifest. Outputs of
+    # earlier builds are kept, so pages rendered before a deploy still find
+    # theirs. Returns {name: (path, sizes)}.
+    built = {}
+    for name, sources in sorted(BUNDLES.items()):
+        separator = '\n' if name.endswith('.css') else ';\n'
+        data = separator.join(read_source(static_folder, source, static_url_path) for source in sources)
+        data = data.encode('utf-8')
+        path = fingerprinted(name, data)
+        built[name] = (path, write_asset(static_folder, path, data))
+    for name in FILES:
+        data = read_source(static_folder, name, static_url_path).encode('utf-8')
+        path = fingerprinted(name, data)
+        built[name] = (path, write_asset(static_folder, path, data))
+
+    with open(os.path.join(static_folder, DIST, MANIFEST), 'w') as f:
+        json.dump(dict((name, path) for name, (path, sizes) in built.items()), f, indent=2, sort_keys=True)
+    return built
+
+
+def build_images(static_folder):
+    # Writes the variants of IMAGES that are not in the image store yet and
+    # records them in the image manifest. Returns {name: variants}.
+    store = images.ImageStore(os.path.join(static_folder, DIST, 'img'))
+    built = {}
+    for name, widths in sorted(IMAGES.items()):
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            built[name] = store.variants(f.read(), widths)
+
+    with open(os.path.join(static_folder, DIST, IMAGE_MANIFEST), 'w') as f:
+        json.dump(built, f, indent=2, sort_keys=True)
+    return built
+
+
+# ----------------------------------------------------------------------------#
+# Serving.
+# ----------------------------------------------------------------------------#
+
+def load_manifest(static_folder, name=MANIFEST):
+    try:
+        with open(os.path.join(static_folder, DIST, name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(name):
+    # URL of the built copy of a bundle or file, or of the file itself when
+    # the assets have not been built.
+    path = current_app.extensions['assets'].get(name)
+    if path is None:
+        return url_for('static', filename=name)
+    return url_for('assets', filename=path[len(DIST) + 1:])
+
+
+def asset_urls(name):
+    # URLs to load for a bundle: the bundle once built, its sources until then.
+    if name in current_app.extensions['assets'] or name not in BUNDLES:
+        return [asset_url(name)]
+    return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+
+def image_set(name):
+    # The built variants of one of IMAGES for templates/layouts/images.html:
+    # {'width', 'height', 'sources': [{'type', 'src', 'srcset'}]}, the
+    # fallback format last; None until the images are built.
+    image = current_app.extensions['asset_images'].get(name)
+    if image is None:
+        return None
+    sources = []
+    for fmt, mimetype, variants in image['sources']:
+        urls = [(width, url_for('assets', filename='img/' + path)) for width, path in variants]
+        sources.append({
+            'type': mimetype,
+            'src': urls[-1][1],
+            'srcset': ', '.join('%s %dw' % (url, width) for width, url in urls)
+        })
+    return {'width': image['width'], 'height': image['height'], 'sources': sources}
+
+
+def send_asset(filename):
+    # Fingerprinted names never change content, so they are cached for good,
+    # and each is sent precompressed in the best encoding the client takes.
+    directory = os.path.join(current_app.static_folder, DIST)
+    if filename.endswith(('.gz', '.br')) or filename in (MANIFEST, IMAGE_MANIFEST):
+        abort(404)
+    encodings = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encodings.quality(encoding) and os.path.isfile(os.path.join(directory, filename + suffix)):
+            break
+    else:
+        encoding = suffix = None
+
+    response = send_from_directory(directory, filename + (suffix or ''),
+                                   mimetype=mimetypes.guess_type(filename)[0],
+                                   max_age=current_app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if filename.endswith(COMPRESSED):
+        response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.extensions['assets'] = load_manifest(app.static_folder)
+    app.extensions['asset_images'] = load_manifest(app.static_folder, IMAGE_MANIFEST)
+    app.add_url_rule(app.static_url_path + '/' + DIST + '/<path:filename>', 'assets', send_asset)
+    app.jinja_env.globals.update(asset_url=asset_url, asset_urls=asset_urls, image_set=image_set)
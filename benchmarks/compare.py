@@ -0,0 +1,57 @@
+"""Compare two benchmarks.run result files route by route.
+
+    python -m benchmarks.compare results/base.json results/head.json --threshold 10
+
+Exits with status 1 when any route's p50 or p95 got slower by more than the
+threshold (in percent), or when a route now issues more queries.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms')
+
+
+def change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+def compare(base, head, threshold):
+    regressions = []
+    for name in sorted(set(base['routes']) & set(head['routes'])):
+        before, after = base['routes'][name], head['routes'][name]
+        cells = []
+        for metric in METRICS:
+            delta = change(before[metric], after[metric])
+            cells.append('%8.2f -> %8.2f ms (%+6.1f%%)' % (before[metric], after[metric], delta))
+            if delta > threshold:
+                regressions.append('%s %s %+.1f%%' % (name, metric, delta))
+        if before['queries'] is not None and after['queries'] is not None and after['queries'] > before['queries']:
+            regressions.append('%s queries %d -> %d' % (name, before['queries'], after['queries']))
+        print('%-22s %s' % (name, '  '.join(cells)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed slowdown in percent')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    if base['rows'] != head['rows']:
+        sys.exit('Results were measured at different scales: %s vs %s' % (base['scale'], head['scale']))
+
+    print('%s (%s) -> %s (%s)' % (base['commit'], base['date'], head['commit'], head['date']))
+    regressions = compare(base, head, args.threshold)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
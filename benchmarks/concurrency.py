@@ -0,0 +1,108 @@
+"""Throughput and latency of running servers under many concurrent clients.
+
+Start the WSGI app and the async read path on two ports against the same
+database, then load both with the same client counts:
+
+    flask run --port 5000 --with-threads
+    uvicorn asgi:app --port 8000
+    python -m benchmarks.concurrency http://localhost:5000 http://localhost:8000 --clients 10,100,500 --slow-ms 200
+
+Every client loops over the paths for --duration seconds on a fresh
+connection per request. --slow-ms makes each client pause between the
+request line and the rest of the headers, the way a client on a slow
+network does, which holds a sync worker for that long.
+"""
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+from benchmarks.stats import percentile, git_commit
+
+DEFAULT_PATHS = ('/venues', '/artists', '/shows', '/venues/1', '/artists/1')
+
+
+async def fetch(host, port, path, slow, timeout):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(('GET %s HTTP/1.1\r\n' % path).encode())
+        await writer.drain()
+        if slow:
+            await asyncio.sleep(slow)
+        writer.write(('Host: %s\r\nConnection: close\r\n\r\n' % host).encode())
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+async def client(host, port, paths, slow, timeout, deadline, samples, errors):
+    n = 0
+    while time.monotonic() < deadline:
+        path = paths[n % len(paths)]
+        n += 1
+        started = time.perf_counter()
+        try:
+            status = await fetch(host, port, path, slow, timeout)
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            errors.append(path)
+            continue
+        if status >= 500:
+            errors.append(path)
+        else:
+            samples.append(time.perf_counter() - started)
+
+
+async def load(url, clients, paths, slow, timeout, duration):
+    parts = urlsplit(url)
+    samples, errors = [], []
+    started = time.monotonic()
+    await asyncio.gather(*[
+        client(parts.hostname, parts.port or 80, paths, slow, timeout, started + duration, samples, errors)
+        for _ in range(clients)
+    ])
+    elapsed = time.monotonic() - started
+    return {
+        'clients': clients,
+        'requests': len(samples),
+        'errors': len(errors),
+        'throughput_rps': len(samples) / elapsed,
+        'p50_ms': percentile(samples, 50) * 1000 if samples else None,
+        'p95_ms': percentile(samples, 95) * 1000 if samples else None,
+        'p99_ms': percentile(samples, 99) * 1000 if samples else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load running servers with many concurrent clients.')
+    parser.add_argument('urls', nargs='+', help='base URL of each server, e.g. http://localhost:5000')
+    parser.add_argument('--clients', default='10,100,500', help='comma-separated concurrent client counts')
+    parser.add_argument('--path', action='append', help='path to request (repeatable)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per server and client count')
+    parser.add_argument('--slow-ms', type=float, default=0, help='pause inside each request, in milliseconds')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds before a request counts as an error')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    paths = args.path or DEFAULT_PATHS
+    results = {}
+    for url in args.urls:
+        results[url] = []
+        for clients in [int(n) for n in args.clients.split(',')]:
+            result = asyncio.run(load(url, clients, paths, args.slow_ms / 1000, args.timeout, args.duration))
+            results[url].append(result)
+            print('%-28s %5d clients  %8.1f req/s  p50 %s  p99 %s  %d errors'
+                  % (url, clients, result['throughput_rps'],
+                     '%8.1f ms' % result['p50_ms'] if result['p50_ms'] is not None else '       -',
+                     '%8.1f ms' % result['p99_ms'] if result['p99_ms'] is not None else '       -',
+                     result['errors']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': git_commit(), 'paths': list(paths), 'slow_ms': args.slow_ms,
+                       'duration': args.duration, 'servers': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
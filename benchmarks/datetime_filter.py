@@ -0,0 +1,60 @@
+"""Per-row cost of the `datetime` Jinja filter.
+
+Compares the old filter (str() of the value, re-parsed with dateutil and
+formatted through babel.dates.format_datetime) with formatting.format_datetime
+on a /shows-like page where many tiles share a start time.
+
+    python -m benchmarks.datetime_filter [--rows 30000] [--distinct 500]
+"""
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+import babel.dates
+import dateutil.parser
+import formatting
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def start_times(rows, distinct, seed=0):
+    rng = random.Random(seed)
+    base = datetime(2020, 7, 1, 20, 0)
+    pool = [base + timedelta(hours=rng.randrange(24 * 365)) for _ in range(distinct)]
+    return [rng.choice(pool) for _ in range(rows)]
+
+
+def per_row_us(func, values, repeat):
+    seconds = min(timeit.repeat(lambda: [func(value, 'full') for value in values], number=1, repeat=repeat))
+    return seconds / len(values) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=30000)
+    parser.add_argument('--distinct', type=int, default=500, help='distinct start times among the rows')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    values = start_times(args.rows, args.distinct)
+    assert all(formatting.format_datetime(v, 'full') == legacy_format_datetime(str(v), 'full') for v in values[:200])
+
+    legacy = per_row_us(lambda v, f: legacy_format_datetime(str(v), f), values, args.repeat)
+    formatting._format.cache_clear()
+    cold = per_row_us(formatting.format_datetime, values[:args.distinct], 1)
+    warm = per_row_us(formatting.format_datetime, values, args.repeat)
+
+    print('legacy filter        %8.2f us/row' % legacy)
+    print('formatting, 1st pass %8.2f us/row' % cold)
+    print('formatting, memoized %8.2f us/row' % warm)
+
+
+if __name__ == '__main__':
+    main()
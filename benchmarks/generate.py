@@ -0,0 +1,128 @@
+"""Fill the configured database with a seeded synthetic catalog.
+
+Point DATABASE_URL at a scratch database first; the venues, artists and
+shows tables are truncated before loading.
+
+    DATABASE_URL=postgresql://localhost/fyyur_bench python -m benchmarks.generate --scale 100k --seed 42
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from app import create_app
+from forms import VenueForm
+from importer import KINDS, batches, load_copy
+from models import db, Show, Venue, Artist
+from queries import refresh_show_counters, refresh_areas
+
+SCALES = {
+    '1k': 1000,
+    '100k': 100000,
+    '1m': 1000000,
+}
+
+ADJECTIVES = ('Blue', 'Velvet', 'Electric', 'Golden', 'Rusty', 'Midnight', 'Crimson', 'Silver', 'Wild', 'Lucky',
+              'Hollow', 'Neon', 'Broken', 'Quiet', 'Royal', 'Savage', 'Tiny', 'Brass', 'Paper', 'Iron')
+NOUNS = ('Hop', 'Lounge', 'Room', 'Hall', 'Cellar', 'Garden', 'Tavern', 'Parlor', 'Club', 'Stage',
+         'Owls', 'Wolves', 'Pianos', 'Strings', 'Rebels', 'Saints', 'Drifters', 'Echoes', 'Foxes', 'Ravens')
+CITIES = (('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'), ('Brooklyn', 'NY'),
+          ('Austin', 'TX'), ('Houston', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA'), ('Portland', 'OR'),
+          ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Denver', 'CO'), ('Boston', 'MA'), ('Miami', 'FL'))
+
+
+def sizes(scale):
+    # `scale` is the number of shows; venues and artists are a tenth each.
+    shows = SCALES[scale] if scale in SCALES else int(scale)
+    return max(shows // 10, 1), max(shows // 10, 1), shows
+
+
+def genre_choices():
+    return [choice[0] for choice in VenueForm.genres.kwargs['choices']]
+
+
+def name(rng, n):
+    return '%s %s %d' % (rng.choice(ADJECTIVES), rng.choice(NOUNS), n)
+
+
+def venues(rng, count, genres):
+    for n in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        yield {
+            'name': name(rng, n), 'city': city, 'state': state, 'address': '%d Main St' % rng.randrange(1, 9999),
+            'phone': '555-%03d-%04d' % (rng.randrange(1000), rng.randrange(10000)),
+            'genres': rng.sample(genres, rng.randint(1, 3)),
+            'image_link': 'https://picsum.photos/id/%d/300' % (n % 1000),
+            'website': None, 'facebook_link': 'https://www.facebook.com/venue%d' % n,
+            'seeking_talent': rng.random() < 0.3, 'seeking_description': None,
+        }
+
+
+def artists(rng, count, genres):
+    for n in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        yield {
+            'name': name(rng, n), 'city': city, 'state': state,
+            'phone': '555-%03d-%04d' % (rng.randrange(1000), rng.randrange(10000)),
+            'genres': rng.sample(genres, rng.randint(1, 3)),
+            'image_link': 'https://picsum.photos/id/%d/300' % (n % 1000),
+            'website': None, 'facebook_link': 'https://www.facebook.com/artist%d' % n,
+            'seeking_venue': rng.random() < 0.3, 'seeking_description': None,
+        }
+
+
+def shows(rng, count, venue_count, artist_count, now):
+    # Two years of past shows and one of upcoming ones, on the hour.
+    for _ in range(count):
+        yield {
+            'venue_id': rng.randint(1, venue_count),
+            'artist_id': rng.randint(1, artist_count),
+            'start_time': now + timedelta(hours=rng.randint(-2 * 365 * 24, 365 * 24)),
+        }
+
+
+def load(table, columns, rows, batch_size=50000):
+    loaded = 0
+    for batch in batches(rows, batch_size):
+        load_copy(db.session.connection(), table, columns, batch)
+        db.session.commit()
+        loaded += len(batch)
+    return loaded
+
+
+def generate(scale, seed=42):
+    rng = random.Random(seed)
+    genres = genre_choices()
+    venue_count, artist_count, show_count = sizes(scale)
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+    db.session.execute(db.text('TRUNCATE shows, venues, artists, areas RESTART IDENTITY CASCADE'))
+    db.session.commit()
+
+    load('venues', KINDS['venues'].columns, venues(rng, venue_count, genres))
+    load('artists', KINDS['artists'].columns, artists(rng, artist_count, genres))
+    load('shows', KINDS['shows'].columns, shows(rng, show_count, venue_count, artist_count, now))
+
+    refresh_show_counters(Venue, Show.venue_id)
+    refresh_show_counters(Artist, Show.artist_id)
+    refresh_areas()
+    db.session.commit()
+
+    with db.engine.connect() as connection:
+        connection.execution_options(isolation_level='AUTOCOMMIT').execute(db.text('ANALYZE'))
+    return venue_count, artist_count, show_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill the database with a seeded synthetic catalog.')
+    parser.add_argument('--scale', default='1k', help='number of shows: 1k, 100k, 1m or an integer')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        started = time.monotonic()
+        counts = generate(args.scale, args.seed)
+    print('Generated %d venues, %d artists, %d shows in %.1fs' % (counts + (time.monotonic() - started,)))
+
+
+if __name__ == '__main__':
+    main()
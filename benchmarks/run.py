@@ -0,0 +1,197 @@
+"""Latency and throughput of every route against the configured database.
+
+Requests go through the Flask test client, so the numbers cover routing,
+queries and rendering but not the network or the WSGI server. Run
+benchmarks.generate at the same scale first. The form submissions are
+measured too; the edits write back the values already stored and the
+venues, artists and shows created are deleted at the end.
+
+    DATABASE_URL=postgresql://localhost/fyyur_bench python -m benchmarks.run --scale 100k -o results/100k.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+# The query counts come from the Server-Timing header.
+os.environ.setdefault('SQL_INSTRUMENTATION', '1')
+
+from app import create_app, page_cache, facet_cache
+from models import db, Show, Venue, Artist
+from queries import encode_show_cursor, refresh_show_counters, refresh_areas
+from benchmarks.generate import sizes
+from benchmarks.stats import percentile, git_commit
+
+
+def sample_ids():
+    # A venue and an artist with shows, and a cursor deep into /shows.
+    venue_id = db.session.query(Show.venue_id).order_by(Show.id).limit(1).scalar()
+    artist_id = db.session.query(Show.artist_id).order_by(Show.id).limit(1).scalar()
+    deep = db.session.query(Show.start_time, Show.id).order_by(Show.start_time.desc(), Show.id.desc()) \
+        .offset(100).limit(1).first()
+    venue_name = db.session.query(Venue.name).filter(Venue.id == venue_id).scalar() or ''
+    artist_name = db.session.query(Artist.name).filter(Artist.id == artist_id).scalar() or ''
+    return venue_id, artist_id, deep, venue_name, artist_name
+
+
+def venue_form(venue):
+    return {'name': venue.name, 'city': venue.city, 'state': venue.state, 'address': venue.address,
+            'phone': venue.phone or '', 'genres': venue.genres, 'facebook_link': venue.facebook_link or ''}
+
+
+def artist_form(artist):
+    return {'name': artist.name, 'city': artist.city, 'state': artist.state, 'phone': artist.phone or '',
+            'genres': artist.genres, 'facebook_link': artist.facebook_link or ''}
+
+
+def routes():
+    venue_id, artist_id, deep, venue_name, artist_name = sample_ids()
+    venue = db.session.get(Venue, venue_id)
+    artist = db.session.get(Artist, artist_id)
+    start_time = (datetime.utcnow() + timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+    deep_cursor = encode_show_cursor(deep.start_time, deep.id) if deep else ''
+    venue_word = venue_name.split()[0] if venue_name else 'blue'
+    artist_word = artist_name.split()[0] if artist_name else 'blue'
+    return [
+        ('index', 'GET', '/', None),
+        ('venues', 'GET', '/venues', None),
+        ('venues_by_genre', 'GET', '/venues?genre=Jazz', None),
+        ('search_venues', 'POST', '/venues/search', {'search_term': venue_word}),
+        ('autocomplete_venues', 'GET', '/venues/autocomplete?q=' + venue_word[:3], None),
+        ('show_venue', 'GET', '/venues/%d' % venue_id, None),
+        ('create_venue_form', 'GET', '/venues/create', None),
+        ('edit_venue', 'GET', '/venues/%d/edit' % venue_id, None),
+        ('artists', 'GET', '/artists', None),
+        ('artists_by_genre', 'GET', '/artists?genre=Jazz', None),
+        ('search_artists', 'POST', '/artists/search', {'search_term': artist_word}),
+        ('autocomplete_artists', 'GET', '/artists/autocomplete?q=' + artist_word[:3], None),
+        ('show_artist', 'GET', '/artists/%d' % artist_id, None),
+        ('create_artist_form', 'GET', '/artists/create', None),
+        ('edit_artist', 'GET', '/artists/%d/edit' % artist_id, None),
+        ('shows', 'GET', '/shows', None),
+        ('shows_deep', 'GET', '/shows?after=' + deep_cursor, None),
+        ('create_shows', 'GET', '/shows/create', None),
+        ('api_venues', 'GET', '/api/v1/venues', None),
+        ('api_venue', 'GET', '/api/v1/venues/%d' % venue_id, None),
+        ('api_artists', 'GET', '/api/v1/artists', None),
+        ('api_artist', 'GET', '/api/v1/artists/%d' % artist_id, None),
+        ('api_shows', 'GET', '/api/v1/shows', None),
+        ('create_venue', 'POST', '/venues/create', dict(venue_form(venue), name='Bench Venue')),
+        ('edit_venue_submission', 'POST', '/venues/%d/edit' % venue_id, venue_form(venue)),
+        ('create_artist', 'POST', '/artists/create', dict(artist_form(artist), name='Bench Artist')),
+        ('edit_artist_submission', 'POST', '/artists/%d/edit' % artist_id, artist_form(artist)),
+        ('create_show', 'POST', '/shows/create',
+         {'venue_id': str(venue_id), 'artist_id': str(artist_id), 'start_time': start_time}),
+    ]
+
+
+def last_ids():
+    return dict((model, db.session.query(func.max(model.id)).scalar() or 0) for model in (Show, Venue, Artist))
+
+
+def delete_created(ids):
+    # Removes what the create routes added, then recounts what they bumped.
+    for model in (Show, Venue, Artist):
+        model.query.filter(model.id > ids[model]).delete(synchronize_session=False)
+    refresh_show_counters(Venue, Show.venue_id)
+    refresh_show_counters(Artist, Show.artist_id)
+    refresh_areas()
+    db.session.commit()
+
+
+def measure(client, method, url, data, requests, warmup, cached):
+    queries = []
+    samples = []
+    for i in range(warmup + requests):
+        if not cached:
+            page_cache.backend.clear()
+            facet_cache.backend.clear()
+        started = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError('%s %s returned %d' % (method, url, response.status_code))
+        if i >= warmup:
+            samples.append(elapsed)
+            timing = re.search(r'desc="(\d+) queries"', response.headers.get('Server-Timing', ''))
+            queries.append(int(timing.group(1)) if timing else None)
+        if method == 'POST':
+            # Drop the flashed message and the read-your-writes stickiness,
+            # so neither piles up nor carries over to the next route.
+            with client.session_transaction() as session:
+                session.clear()
+
+    return {
+        'requests': requests,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'mean_ms': statistics.mean(samples) * 1000,
+        'throughput_rps': requests / sum(samples),
+        'queries': max(queries) if queries and None not in queries else None,
+        'bytes': len(response.get_data()),
+    }
+
+
+def run(scale, requests, warmup, cached, only=None):
+    app = create_app()
+    app.config['SQL_STRICT'] = False
+    venue_count, artist_count, show_count = sizes(scale)
+    results = {}
+    with app.app_context():
+        actual = db.session.query(Show).count()
+        if actual != show_count:
+            raise SystemExit('Database holds %d shows, scale %s expects %d; run benchmarks.generate first'
+                             % (actual, scale, show_count))
+        plan = routes()
+        ids = last_ids()
+
+    client = app.test_client()
+    try:
+        for name, method, url, data in plan:
+            if only and name not in only:
+                continue
+            results[name] = measure(client, method, url, data, requests, warmup, cached)
+            print('%-22s p50 %8.2f ms  p95 %8.2f ms  %7.1f req/s  %s queries'
+                  % (name, results[name]['p50_ms'], results[name]['p95_ms'], results[name]['throughput_rps'],
+                     results[name]['queries']))
+    finally:
+        with app.app_context():
+            delete_created(ids)
+
+    return {
+        'commit': git_commit(),
+        'date': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'scale': scale,
+        'rows': {'venues': venue_count, 'artists': artist_count, 'shows': show_count},
+        'requests': requests,
+        'page_cache': cached,
+        'routes': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route against the configured database.')
+    parser.add_argument('--scale', default='1k', help='scale the database was generated with')
+    parser.add_argument('--requests', type=int, default=50, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per route')
+    parser.add_argument('--cached', action='store_true', help='leave the page and facet caches on')
+    parser.add_argument('--route', action='append', help='only benchmark this route (repeatable)')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    report = run(args.scale, args.requests, args.warmup, args.cached, args.route)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Check the thumbnail proxy against a local stub HTTP server.
+
+Serves generated images from http.server on a loopback port, points a
+thumbnails.Thumbnails built from the THUMBNAIL_* settings at it (with
+THUMBNAIL_ALLOW_PRIVATE_HOSTS set, since the stub is on 127.0.0.1) and
+checks single-flight fetching, failure caching, LRU eviction and the
+limits on the source fetch. Needs Pillow but no database:
+
+    python -m benchmarks.thumbnail_proxy
+
+Exits non-zero when a check fails.
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+import images
+from thumbnails import Thumbnails, FetchError
+
+
+def encoded(size, fmt='JPEG'):
+    output = io.BytesIO()
+    images.Image.new('RGB', size, (200, 80, 40)).save(output, fmt)
+    return output.getvalue()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # /photo/<name>: the same JPEG under any name, after `delay` seconds
+    # /huge.png: a PNG of more pixels than THUMBNAIL_MAX_SOURCE_PIXELS
+    # /trickle.jpg: a byte at a time, slower than the fetch timeout allows
+    # anything else: 404
+    server_version = 'Stub'
+
+    def do_GET(self):
+        stub = self.server
+        with stub.lock:
+            stub.hits[self.path] += 1
+        if self.path.startswith('/photo/'):
+            time.sleep(stub.delay)
+            self.send_body(stub.photo)
+        elif self.path == '/huge.png':
+            self.send_body(stub.huge)
+        elif self.path == '/trickle.jpg':
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(stub.photo)))
+            self.end_headers()
+            try:
+                for i in range(len(stub.photo)):
+                    self.wfile.write(stub.photo[i:i + 1])
+                    self.wfile.flush()
+                    time.sleep(0.2)
+            except OSError:
+                pass
+        else:
+            self.send_error(404)
+
+    def send_body(self, data):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(delay):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.hits = Counter()
+    server.delay = delay
+    server.photo = encoded((1600, 1000))
+    # Compresses to a few kB, so only the pixel cap stops it.
+    server.huge = encoded((8000, 6000), 'PNG')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def settings(directory, **overrides):
+    values = dict((name, getattr(config, name)) for name in dir(config) if name.startswith('THUMBNAIL_'))
+    values.update(THUMBNAIL_CACHE_DIR=directory, THUMBNAIL_ALLOW_PRIVATE_HOSTS=True)
+    values.update(overrides)
+    return values
+
+
+def variants(thumbnails):
+    return [(width, fmt) for width in thumbnails.widths for fmt in thumbnails.formats]
+
+
+def cached(thumbnails, link):
+    return all(thumbnails.cache.get(thumbnails.key(link, width, fmt)) is not None
+               for width, fmt in variants(thumbnails))
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(directory) for name in files)
+
+
+# ----------------------------------------------------------------------------#
+# Checks.
+# ----------------------------------------------------------------------------#
+
+def check_single_flight(stub, base, directory, clients):
+    # Concurrent requests for every variant of a new link cause one fetch,
+    # and later requests are served from disk.
+    thumbnails = Thumbnails(settings(directory))
+    link = base + '/photo/single-flight.jpg'
+    wanted = variants(thumbnails)
+    barrier = threading.Barrier(clients)
+    results, errors = [], []
+
+    def client(n):
+        width, fmt = wanted[n % len(wanted)]
+        barrier.wait()
+        try:
+            results.append(thumbnails.get(link, width, fmt))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    assert len(results) == clients and all(results), results
+    assert stub.hits['/photo/single-flight.jpg'] == 1, stub.hits['/photo/single-flight.jpg']
+    assert cached(thumbnails, link)
+    assert isinstance(thumbnails.get(link, *wanted[0]), str)
+    assert stub.hits['/photo/single-flight.jpg'] == 1
+    return '%d concurrent requests, 1 fetch' % clients
+
+
+def check_failures_cached(stub, base, directory):
+    # A link that failed is not fetched again within THUMBNAIL_RETRY_AFTER.
+    thumbnails = Thumbnails(settings(directory))
+    link = base + '/missing.jpg'
+    width, fmt = variants(thumbnails)[0]
+    for _ in range(3):
+        try:
+            thumbnails.get(link, width, fmt)
+        except FetchError:
+            pass
+        else:
+            raise AssertionError('a 404 made a thumbnail')
+    assert stub.hits['/missing.jpg'] == 1, stub.hits['/missing.jpg']
+    return '3 requests, 1 fetch'
+
+
+def check_lru_eviction(stub, base, directory):
+    # With room for about two links' thumbnails, a third link evicts the
+    # least recently used one and keeps the one read in between.
+    measure = os.path.join(directory, 'measure')
+    Thumbnails(settings(measure)).make(base + '/photo/measure.jpg')
+    per_link = directory_bytes(measure)
+
+    thumbnails = Thumbnails(settings(os.path.join(directory, 'lru'), THUMBNAIL_CACHE_BYTES=int(per_link * 2.5)))
+    first, second, third = [base + '/photo/lru-%d.jpg' % n for n in range(3)]
+    for link in (first, second):
+        thumbnails.get(link, *variants(thumbnails)[0])
+        time.sleep(0.05)
+    assert cached(thumbnails, first)
+    time.sleep(0.05)
+    thumbnails.get(third, *variants(thumbnails)[0])
+    assert cached(thumbnails, first), 'the recently read link was evicted'
+    assert cached(thumbnails, third), 'the new link was evicted'
+    assert not any(thumbnails.cache.get(thumbnails.key(second, width, fmt))
+                   for width, fmt in variants(thumbnails)), 'the least recently used link was kept'
+    assert directory_bytes(thumbnails.cache.directory) <= thumbnails.cache.max_bytes
+    return '%d kB per link, limit %d kB' % (per_link // 1024, thumbnails.cache.max_bytes // 1024)
+
+
+def check_fetch_deadline(stub, base, directory):
+    # A source that keeps sending, only slowly, fails at the timeout.
+    thumbnails = Thumbnails(settings(directory, THUMBNAIL_FETCH_TIMEOUT=1))
+    started = time.monotonic()
+    try:
+        thumbnails.make(base + '/trickle.jpg')
+    except FetchError as error:
+        message = str(error)
+    else:
+        raise AssertionError('the trickled image was accepted')
+    elapsed = time.monotonic() - started
+    assert elapsed < 2, elapsed
+    return '%s after %.1f s' % (message, elapsed)
+
+
+def check_pixel_cap(stub, base, directory):
+    thumbnails = Thumbnails(settings(directory))
+    try:
+        thumbnails.make(base + '/huge.png')
+    except FetchError as error:
+        return str(error)
+    raise AssertionError('the %d-byte 48 MP image was accepted' % len(stub.huge))
+
+
+def check_refused_links(stub, base, directory):
+    # Bad URLs, and loopback hosts without THUMBNAIL_ALLOW_PRIVATE_HOSTS.
+    refused = [(settings(directory), 'http://example.com:99999/x.jpg'),
+               (settings(directory), 'ftp://example.com/x.jpg'),
+               (settings(directory, THUMBNAIL_ALLOW_PRIVATE_HOSTS=False), base + '/photo/private.jpg')]
+    for values, link in refused:
+        try:
+            Thumbnails(values).make(link)
+        except FetchError:
+            continue
+        raise AssertionError('%s was fetched' % link)
+    assert stub.hits['/photo/private.jpg'] == 0
+    return '%d links' % len(refused)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the thumbnail proxy against a local stub HTTP server.')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent requests in the single-flight check')
+    parser.add_argument('--delay', type=float, default=0.3, help='seconds the stub waits before sending an image')
+    args = parser.parse_args()
+    if images.Image is None:
+        sys.exit('The thumbnail proxy needs Pillow: pip install Pillow')
+
+    stub = start_stub(args.delay)
+    base = 'http://127.0.0.1:%d' % stub.server_address[1]
+    directory = tempfile.mkdtemp(prefix='fyyur-thumbnails-')
+    checks = [
+        ('single-flight', lambda: check_single_flight(stub, base, os.path.join(directory, 'single'), args.clients)),
+        ('failures cached', lambda: check_failures_cached(stub, base, os.path.join(directory, 'failures'))),
+        ('LRU eviction', lambda: check_lru_eviction(stub, base, os.path.join(directory, 'eviction'))),
+        ('fetch deadline', lambda: check_fetch_deadline(stub, base, os.path.join(directory, 'deadline'))),
+        ('pixel cap', lambda: check_pixel_cap(stub, base, os.path.join(directory, 'pixels'))),
+        ('refused links', lambda: check_refused_links(stub, base, os.path.join(directory, 'refused'))),
+    ]
+    failed = 0
+    try:
+        for name, check in checks:
+            try:
+                detail = check()
+            except AssertionError as error:
+                failed += 1
+                print('FAIL %-16s %s' % (name, error or traceback.format_exc().strip().splitlines()[-2]))
+            else:
+                print('ok   %-16s %s' % (name, detail))
+    finally:
+        stub.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
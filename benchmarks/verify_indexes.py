@@ -0,0 +1,77 @@
+"""Check that the planner uses the lookup indexes for the queries the pages issue.
+
+Run it against a database at a realistic size, e.g. after
+`python -m benchmarks.generate --scale 100k`; on a near-empty table a
+sequential scan is the right plan and the check fails.
+
+    DATABASE_URL=postgresql://localhost/fyyur_bench python -m benchmarks.verify_indexes --analyze
+"""
+import argparse
+import sys
+from datetime import datetime
+from flask import current_app
+from app import create_app
+from models import db, Show, Venue, Artist
+from queries import show_timeline_query, venue_areas_query, show_feed_query, encode_show_cursor
+
+
+def plan_indexes(query):
+    # Names of the indexes the plan of `query` scans.
+    compiled = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    plan = db.session.connection() \
+        .exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params) \
+        .scalar()
+    found = set()
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if 'Index Name' in node:
+            found.add(node['Index Name'])
+        nodes.extend(node.get('Plans', ()))
+    return found
+
+
+def checks():
+    venue_id = db.session.query(Show.venue_id).order_by(Show.id).limit(1).scalar()
+    artist_id = db.session.query(Show.artist_id).order_by(Show.id).limit(1).scalar()
+    now = datetime.utcnow()
+    per_page = current_app.config['SHOWS_PER_PAGE'] + 1
+    return [
+        ('venue timeline', show_timeline_query(Show.venue_id, venue_id, Artist, Show.artist_id),
+         'ix_shows_venue_id_start_time'),
+        ('artist timeline', show_timeline_query(Show.artist_id, artist_id, Venue, Show.venue_id),
+         'ix_shows_artist_id_start_time'),
+        ('show feed', show_feed_query().limit(per_page), 'ix_shows_start_time_id'),
+        ('show feed from cursor', show_feed_query(encode_show_cursor(now, 0)).limit(per_page),
+         'ix_shows_start_time_id'),
+        ('area summary refresh', venue_areas_query(), 'ix_venues_city_state'),
+    ]
+
+
+def verify():
+    failed = 0
+    for name, query, index in checks():
+        used = plan_indexes(query)
+        ok = index in used
+        failed += not ok
+        print('%-4s %-24s expects %-30s uses %s' % ('ok' if ok else 'FAIL', name, index, ', '.join(sorted(used)) or '-'))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that the page queries use the lookup indexes.')
+    parser.add_argument('--analyze', action='store_true',
+                        help='VACUUM ANALYZE the tables first so statistics and visibility maps are current')
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        if args.analyze:
+            with db.engine.connect() as connection:
+                connection.execution_options(isolation_level='AUTOCOMMIT') \
+                    .execute(db.text('VACUUM ANALYZE shows, venues, artists'))
+        failed = verify()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+TEMP_PREFIX = '.tmp-'
+
+
+def write_file(path, data):
+    # Written to a temporary file and renamed, so a concurrent reader sees
+    # the whole file or none.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+class LRUCache(object):
+    # Thread-safe, size-bounded in-process cache with per-entry expiry.
+    # Any object with the same get/set/delete methods (e.g. a thin wrapper
+    # around a shared memcached or redis client) can stand in for it.
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FileGenerations(object):
+    # String values in small files under `directory`, with the get/set of
+    # LRUCache and no expiry. PageCache keeps its generations here so that
+    # every worker process on the host sees an invalidation any of them
+    # made, while the pages themselves stay in each worker's memory.
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, re.sub(r'[^\w.-]', '_', key))
+
+    def get(self, key):
+        try:
+            with open(self.path(key), encoding='utf-8') as f:
+                return f.read() or None
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value, ttl=None):
+        write_file(self.path(key), value.encode('utf-8'))
+
+
+class PageCache(object):
+    # Rendered pages keyed by endpoint, generation and full request path.
+    # Invalidating an endpoint gives it a new generation, so stale entries
+    # are never read again and age out of the backend on their own; this
+    # works the same against a shared backend without prefix deletes. A
+    # generation that went missing (evicted, backend restarted) is replaced
+    # by a new one, which also orphans everything stored under the old one.
+    # Generations live in `generations` when given (e.g. FileGenerations,
+    # for workers that each have their own backend), else in the backend,
+    # and start with the time they were made.
+
+    def __init__(self, backend, ttl=60, generations=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.generations = generations
+
+    def _store(self):
+        return self.generations if self.generations is not None else self.backend
+
+    def _new_generation(self, endpoint):
+        generation = '%.3f-%s' % (time.time(), uuid.uuid4().hex)
+        self._store().set('gen:' + endpoint, generation)
+        return generation
+
+    def _generation(self, endpoint):
+        return self._store().get('gen:' + endpoint) or self._new_generation(endpoint)
+
+    def invalidated_at(self, endpoint):
+        # time.time() of the last invalidation of `endpoint`, or later.
+        try:
+            return float(self._generation(endpoint).split('-')[0])
+        except ValueError:
+            return 0.0
+
+    def key(self, endpoint, path):
+        return 'page:%s:%s:%s' % (endpoint, self._generation(endpoint), path)
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, body):
+        self.backend.set(key, body, self.ttl)
+
+    def invalidate(self, *endpoints):
+        for endpoint in endpoints:
+            self._new_generation(endpoint)
+
+
+class DiskLRUCache(object):
+    # Files under `directory` bounded to `max_bytes` in total, evicting the
+    # least recently used. Recency is the file's mtime, which reads bump, so
+    # every worker sharing the directory sees the same order; each worker
+    # keeps its own running total and rescans the directory before evicting.
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        # Path of the file stored under `key` (a hex digest), or None.
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def set(self, key, data):
+        path = self.path(key)
+        write_file(path, data)
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for mtime, size, path in self._scan())
+            else:
+                self._total += len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+        return path
+
+    def _scan(self):
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith(TEMP_PREFIX):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        return entries
+
+    def _evict(self):
+        # Down to nine tenths of the limit, so the next few writes do not
+        # each trigger a rescan.
+        entries = sorted(self._scan())
+        self._total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if self._total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._total -= size
+
+
+class Coalescer(object):
+    # Runs one call per key at a time: callers that ask for a key while its
+    # call is in flight wait for it and get the same result or exception.
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+        if leader:
+            try:
+                call['result'] = function()
+            except Exception as error:
+                call['error'] = error
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call['done'].set()
+        else:
+            call['done'].wait()
+        if 'error' in call:
+            raise call['error']
+        return call['result']
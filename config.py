@@ -1,13 +1,136 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Signs the session cookie, which carries flashed messages and the
+# read-your-writes stickiness of replica routing, so every process of a
+# server must share it and it must survive restarts. The production entry
+# points (wsgi.py, asgi.py) refuse to start without it; the development
+# server and the flask command make up a key per process.
+SECRET_KEY = os.environ.get('SECRET_KEY')
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Enable debug mode.
 DEBUG = True
 
+
+def psycopg2_uri(uri):
+    # SQLAlchemy 2 rejects the postgres:// scheme Heroku-style URLs use, and
+    # maps postgresql:// to psycopg 3; requirements.txt installs psycopg2.
+    for scheme in ('postgres://', 'postgresql://'):
+        if uri.startswith(scheme):
+            return 'postgresql+psycopg2://' + uri[len(scheme):]
+    return uri
+
+
 # Connect to the database
 # DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://rob@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = psycopg2_uri(os.environ.get('DATABASE_URL', 'postgresql://rob@localhost:5432/fyyur'))
 
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Read replicas, comma separated in DATABASE_REPLICA_URLS. Views marked
+# @read_only query one of them unless it is more than REPLICA_MAX_LAG
+# seconds behind the primary (measured every REPLICA_CHECK_INTERVAL
+# seconds per worker); a client that has just written reads from the
+# primary for REPLICA_STICKY_SECONDS so it sees its own changes. Replica
+# connections give up after REPLICA_CONNECT_TIMEOUT seconds and queries
+# on them after REPLICA_STATEMENT_TIMEOUT milliseconds, so an unreachable
+# or stuck replica stalls the request that measures its lag only briefly.
+REPLICA_DATABASE_URIS = [psycopg2_uri(uri) for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+REPLICA_MAX_LAG = 5
+REPLICA_CHECK_INTERVAL = 5
+REPLICA_STICKY_SECONDS = 10
+REPLICA_CONNECT_TIMEOUT = 2
+REPLICA_STATEMENT_TIMEOUT = 10000
+SQLALCHEMY_BINDS = {
+    'replica%d' % n: {
+        'url': uri,
+        'connect_args': {
+            'connect_timeout': REPLICA_CONNECT_TIMEOUT,
+            'options': '-c statement_timeout=%d' % REPLICA_STATEMENT_TIMEOUT
+        }
+    }
+    for n, uri in enumerate(REPLICA_DATABASE_URIS)
+}
+
+# Async read path (asgi.py): database URL, defaults to DATABASE_URL with
+# the asyncpg driver, and connections kept per worker
+ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URL')
+ASYNC_POOL_SIZE = 20
+ASYNC_MAX_OVERFLOW = 10
+
+# Number of shows per page on /shows
+SHOWS_PER_PAGE = 30
+
+# Maximum number of suggestions returned by the autocomplete endpoints, and
+# seconds between checks of each worker's index against the tables, which
+# bounds how long names added or edited through another worker are missing
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_RELOAD_INTERVAL = 30
+
+# Keep JSON responses compact, even in debug mode
+JSONIFY_PRETTYPRINT_REGULAR = False
+
+# Seconds browsers and CDNs may cache the fingerprinted bundles built by
+# `flask build-assets` (under /static/dist); a changed file gets a new name
+ASSETS_MAX_AGE = 365 * 24 * 3600
+
+# Thumbnails of venue and artist image links served by /img/<kind>/<id>
+# (thumbnails.py): disk cache location and size in bytes, widths offered
+# to the browser (tiles show at most 320x200 CSS pixels, so each width is
+# fitted into a box HEIGHT_RATIO as high), limits on the source fetch
+# (seconds for the whole fetch, redirects included, bytes, and pixels,
+# checked before the image is decoded), seconds before a failed link is
+# tried again, and browser cache seconds.
+# Links to private or loopback addresses are refused unless
+# ALLOW_PRIVATE_HOSTS is set, e.g. to test against a local stub server.
+THUMBNAIL_CACHE_DIR = os.environ.get('THUMBNAIL_CACHE_DIR', os.path.join(basedir, 'thumbnails'))
+THUMBNAIL_CACHE_BYTES = 512 * 1024 * 1024
+THUMBNAIL_WIDTHS = (160, 320, 480, 640)
+THUMBNAIL_HEIGHT_RATIO = 200 / 320
+THUMBNAIL_FETCH_TIMEOUT = 10
+THUMBNAIL_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+THUMBNAIL_MAX_SOURCE_PIXELS = 40 * 1000 * 1000
+THUMBNAIL_RETRY_AFTER = 300
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+THUMBNAIL_ALLOW_PRIVATE_HOSTS = False
+
+# Rendered listing pages (/venues, /artists, /shows): number of entries
+# kept per worker and seconds before an entry expires
+PAGE_CACHE_SIZE = 256
+PAGE_CACHE_TTL = 60
+
+# Genre and city/state facet counts of the venue and artist listings and
+# searches: number of filter combinations kept per worker and seconds
+# before an entry expires
+FACET_CACHE_SIZE = 256
+FACET_CACHE_TTL = 300
+
+# Where the page and facet caches keep the generation of each endpoint,
+# so an invalidation reaches every worker sharing the directory (all of
+# them on one host); servers on other hosts catch up within the TTLs.
+CACHE_GENERATIONS_DIR = os.environ.get('CACHE_GENERATIONS_DIR', os.path.join(basedir, 'cache_generations'))
+
+# Default and maximum page size of the /api/v1 list endpoints
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Stream /venues and /shows straight from a server-side cursor into the
+# template instead of rendering them in one go. Streamed pages skip the
+# page cache; /shows is still paged by SHOWS_PER_PAGE.
+STREAM_LISTING_PAGES = False
+# Rows fetched per round trip from the server-side cursor
+STREAM_BATCH_SIZE = 500
+# Template chunks buffered before each write to the client
+STREAM_BUFFER_SIZE = 20
+
+# Per-request SQL statistics: Server-Timing header and one line per
+# request in sql.log. In strict mode (meant for tests) a request raises
+# QueryBudgetExceeded when it issues more queries than its view's
+# @query_budget (SQL_QUERY_BUDGET when it has none) or repeats one
+# statement SQL_REPEAT_THRESHOLD times or more. Off unless the
+# SQL_INSTRUMENTATION environment variable is 1, so production responses
+# carry no Server-Timing header and nothing is logged per request.
+SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION') == '1'
+SQL_STRICT = False
+SQL_QUERY_BUDGET = 10
+SQL_REPEAT_THRESHOLD = 3
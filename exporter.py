@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from models import db, Show, Venue, Artist
+
+EXPORT_COLUMNS = {
+    'venues': (Venue, ('id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'website',
+                       'facebook_link', 'seeking_talent', 'seeking_description', 'upcoming_shows_count',
+                       'past_shows_count', 'updated_at')),
+    'artists': (Artist, ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link', 'website',
+                         'facebook_link', 'seeking_venue', 'seeking_description', 'upcoming_shows_count',
+                         'past_shows_count', 'updated_at')),
+    'shows': (Show, ('id', 'venue_id', 'artist_id', 'start_time', 'updated_at')),
+}
+
+FORMATS = ('ndjson', 'csv')
+
+
+def export_rows(kind, since=None, batch_size=1000):
+    # Rows come off a server-side cursor batch_size at a time, so memory use
+    # does not depend on the table size. `since` limits the export to rows
+    # created or updated at or after that time.
+    model, columns = EXPORT_COLUMNS[kind]
+    query = db.session.query(*[getattr(model, column) for column in columns])
+    if since is not None:
+        query = query.filter(model.updated_at >= since)
+    return query.order_by(model.id).yield_per(batch_size)
+
+
+def json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return ','.join(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode(rows, columns, fmt, chunk_rows=500):
+    # Yields text chunks of about chunk_rows rows each.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+
+    count = 0
+    for row in rows:
+        if fmt == 'csv':
+            writer.writerow([csv_value(value) for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(columns, row)), default=json_value, separators=(',', ':')))
+            buffer.write('\n')
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(kind, fmt='ndjson', since=None, gzip=False, batch_size=1000):
+    # Byte chunks of the whole export, ready to be streamed to a response
+    # or a file.
+    columns = EXPORT_COLUMNS[kind][1]
+    chunks = encode(export_rows(kind, since, batch_size), columns, fmt)
+    if gzip:
+        return gzipped(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
@@ -7,12 +7,17 @@ from fabric.contrib.console import confirm
 def test():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m compileall -q . && python -m benchmarks.thumbnail_proxy", capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
 
+def bench(scale='1k', output=None):
+    local("python -m benchmarks.generate --scale {}".format(scale))
+    local("python -m benchmarks.run --scale {}{}".format(scale, " -o " + output if output else ""))
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -38,18 +43,11 @@ def heroku():
     local("git push heroku master")
 
 
-def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
-
-
 def deploy():
     pull()
     test()
     commit()
     heroku()
-    heroku_test()
 
 # rollback
 
@@ -0,0 +1,48 @@
+import functools
+
+# babel and dateutil are imported on first use: a worker that only serves
+# the JSON API or form posts never needs babel, and most never parse a
+# free-form date.
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_locale(locale=None):
+    import babel.dates
+    return babel.Locale.parse(locale or babel.dates.LC_TIME)
+
+
+@functools.lru_cache(maxsize=256)
+def get_pattern(format):
+    # Compiled Babel pattern for one of DATETIME_FORMATS or a raw pattern.
+    import babel.dates
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+
+@functools.lru_cache(maxsize=4096)
+def _format(value, format, locale):
+    return get_pattern(format).apply(value, get_locale(locale))
+
+
+def format_datetime(value, format='medium', locale=None):
+    # Same output as babel.dates.format_datetime(value, pattern) for the
+    # patterns above: naive values are taken as UTC, aware ones are shown in
+    # their own zone. Recently formatted naive values are memoized, so the
+    # many tiles sharing a start time on a page are only formatted once;
+    # aware values are not, as equal instants in different zones compare
+    # equal but format differently.
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value.tzinfo is not None:
+        return get_pattern(format).apply(value, get_locale(locale))
+    return _format(value, format, locale)
+
+
+def parse_datetime(value):
+    # dateutil.parser.parse, imported on first use.
+    import dateutil.parser
+    return dateutil.parser.parse(value)
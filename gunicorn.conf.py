@@ -0,0 +1,50 @@
+# ----------------------------------------------------------------------------#
+# Gunicorn settings for wsgi:app.
+#
+# The app is imported and warmed up once in the master process and the
+# workers are forked from it, so they start with the templates compiled and
+# the typeahead indexes loaded. Connections must not cross the fork: the
+# master closes its pools once it is warm, and every worker drops whatever
+# it inherited before opening its own.
+# ----------------------------------------------------------------------------#
+
+import multiprocessing
+import os
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '5000')
+
+# Two processes per core plus one, each serving GUNICORN_THREADS requests
+# at a time. The threads overlap the waits on Postgres, but the GIL lets
+# only one of them render at a time, so a single process per core leaves
+# the core idle whenever all of its threads wait together; the second
+# process fills those gaps, and the extra one covers a worker restarting
+# after max_requests. Every thread may hold a connection from each of its
+# worker's pools, so workers * threads should stay under the database's
+# max_connections.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Restart workers now and then so slow leaks do not pile up; the jitter
+# keeps them from all restarting at once.
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+
+
+def when_ready(server):
+    from app import warm_up, dispose_engines
+    app = server.app.wsgi()
+    warm_up(app)
+    dispose_engines(app)
+
+
+def post_fork(server, worker):
+    from app import dispose_engines
+    dispose_engines(server.app.wsgi(), close=False)
@@ -0,0 +1,110 @@
+import hashlib
+import io
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+from cache import write_file
+
+# Encodings of the variants, most preferred first; the last one is the
+# fallback every browser decodes. (Pillow format, MIME type, save options)
+FORMATS = [
+    ('avif', ('AVIF', 'image/avif', {'quality': 50})),
+    ('webp', ('WEBP', 'image/webp', {'quality': 75, 'method': 6})),
+    ('jpeg', ('JPEG', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True})),
+]
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def available_formats():
+    # The FORMATS this Pillow build can write (AVIF needs Pillow 11.2+).
+    if Image is None:
+        return []
+    Image.init()
+    return [name for name, (pil_format, mimetype, options) in FORMATS if pil_format in Image.SAVE]
+
+
+def scale(image, width):
+    # `image` scaled down to `width` pixels wide.
+    if image.width <= width:
+        return image
+    return image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+
+def fit(image, width, height):
+    # `image` scaled down to fit within `width` x `height` pixels.
+    ratio = min(width / image.width, height / image.height)
+    if ratio >= 1:
+        return image
+    return image.resize((max(1, round(image.width * ratio)), max(1, round(image.height * ratio))), Image.LANCZOS)
+
+
+def open_image(data, max_pixels=None, size=None):
+    # Rotated upright: the variants drop the EXIF orientation. Images of
+    # more than `max_pixels` raise ValueError before they are decoded, and
+    # JPEGs are decoded at the smallest scale still covering `size`.
+    image = Image.open(io.BytesIO(data))
+    if max_pixels is not None and image.width * image.height > max_pixels:
+        raise ValueError('%dx%d is more than %d pixels' % (image.width, image.height, max_pixels))
+    if size is not None and image.format == 'JPEG':
+        image.draft('RGB', size)
+    return ImageOps.exif_transpose(image)
+
+
+def encode(image, fmt):
+    pil_format, mimetype, options = dict(FORMATS)[fmt]
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, pil_format, **options)
+    return output.getvalue()
+
+
+class ImageStore(object):
+    # Content-addressed directory of processed images. A variant is named
+    # after the digest of its source bytes and the settings it is encoded
+    # with, so each is encoded once and then reused by every build, worker
+    # and request that asks for it; changing a setting gives new names.
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def name(self, digest, width, fmt):
+        key = hashlib.sha256(('%s %d %s %r' % (digest, width, fmt, sorted(dict(FORMATS)[fmt][2].items())))
+                             .encode('utf-8')).hexdigest()[:32]
+        return '%s/%s.%s' % (key[:2], key, EXTENSIONS[fmt])
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def put(self, name, data):
+        write_file(self.path(name), data)
+
+    def variants(self, data, widths, formats=None):
+        # Encodes the missing variants of the image `data` at each of
+        # `widths` (capped at its own width) in each format. Returns
+        # {'width', 'height', 'sources': [(fmt, mimetype, [(width, name)])]}
+        # with the sources in order of preference.
+        digest = hashlib.sha256(data).hexdigest()
+        image = open_image(data)
+        formats = [fmt for fmt, options in FORMATS if fmt in (formats or available_formats())]
+        widths = sorted(set(min(width, image.width) for width in widths))
+        names = dict((fmt, []) for fmt in formats)
+        for width in widths:
+            scaled = None
+            for fmt in formats:
+                name = self.name(digest, width, fmt)
+                if not os.path.exists(self.path(name)):
+                    # Each width is scaled once, and only when a format is missing.
+                    if scaled is None:
+                        scaled = scale(image, width)
+                    self.put(name, encode(scaled, fmt))
+                names[fmt].append((width, name))
+        return {
+            'width': image.width,
+            'height': image.height,
+            'sources': [(fmt, dict(FORMATS)[fmt][1], names[fmt]) for fmt in formats]
+        }
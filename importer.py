@@ -0,0 +1,285 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from wtforms.fields import SelectMultipleField, DateTimeField
+from wtforms.fields.core import UnboundField
+from wtforms.validators import DataRequired, URL
+from forms import VenueForm, ArtistForm, ShowForm
+from formatting import parse_datetime
+from models import db, Show, Venue, Artist
+from queries import refresh_show_counters, refresh_areas
+
+
+# ----------------------------------------------------------------------------#
+# Validation.
+# ----------------------------------------------------------------------------#
+
+class FormRules(object):
+    # The checks a form class declares (required fields, choices, URLs,
+    # datetimes), read once from its unbound fields and applied to plain
+    # dict rows without building a form per row.
+
+    def __init__(self, form_class):
+        self.fields = []
+        for name in dir(form_class):
+            unbound = getattr(form_class, name)
+            if not isinstance(unbound, UnboundField):
+                continue
+            validators = unbound.kwargs.get('validators') or []
+            choices = unbound.kwargs.get('choices')
+            self.fields.append((
+                name,
+                any(isinstance(v, DataRequired) for v in validators),
+                set(choice[0] for choice in choices) if choices else None,
+                [v for v in validators if isinstance(v, URL)],
+                issubclass(unbound.field_class, SelectMultipleField),
+                issubclass(unbound.field_class, DateTimeField),
+            ))
+
+    def clean(self, row):
+        errors = []
+        for name, required, choices, urls, multiple, is_datetime in self.fields:
+            value = row.get(name)
+            if multiple and isinstance(value, str):
+                value = [v.strip() for v in value.split(',') if v.strip()]
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                # NDJSON numbers, e.g. a phone number or an id.
+                value = str(value)
+            if not value:
+                if required:
+                    errors.append('%s is required' % name)
+                row[name] = [] if multiple else None
+                continue
+
+            if multiple:
+                if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+                    errors.append('%s: expected a list of strings' % name)
+                    continue
+            elif not isinstance(value, str) and not (is_datetime and isinstance(value, datetime)):
+                errors.append('%s: expected a string' % name)
+                continue
+            if choices is not None:
+                bad = [v for v in (value if multiple else [value]) if v not in choices]
+                if bad:
+                    errors.append('%s: invalid choice %s' % (name, ', '.join(bad)))
+            for validator in urls:
+                if not validator.regex.match(value):
+                    errors.append('%s: invalid URL' % name)
+            if is_datetime and not isinstance(value, datetime):
+                try:
+                    value = parse_datetime(value)
+                except (ValueError, OverflowError):
+                    errors.append('%s: invalid datetime' % name)
+            row[name] = value
+        return errors
+
+
+def parse_bool(value):
+    if not isinstance(value, str):
+        return bool(value)
+    return value.strip().lower() in ('1', 't', 'true', 'y', 'yes')
+
+
+# ----------------------------------------------------------------------------#
+# Sources.
+# ----------------------------------------------------------------------------#
+
+def read_rows(stream, fmt):
+    if fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        for row in csv.DictReader(stream):
+            yield row
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ----------------------------------------------------------------------------#
+# Kinds.
+# ----------------------------------------------------------------------------#
+
+class Kind(object):
+    def __init__(self, model, form_class, columns, booleans=()):
+        self.model = model
+        self.rules = FormRules(form_class)
+        self.columns = columns
+        self.booleans = booleans
+
+    def clean(self, batch):
+        # Returns (records, rejected) where rejected is [(line, errors)].
+        records, rejected = [], []
+        for line, row in batch:
+            if not isinstance(row, dict):
+                rejected.append((line, ['expected an object']))
+                continue
+            row = dict(row)
+            errors = self.rules.clean(row)
+            if errors:
+                rejected.append((line, errors))
+                continue
+
+            record = {}
+            for column in self.columns:
+                value = row.get(column)
+                record[column] = parse_bool(value) if column in self.booleans else (value if value != '' else None)
+            records.append(record)
+        return records, rejected
+
+
+class ShowKind(Kind):
+    # Shows may reference venues and artists by id or by name; both are
+    # resolved with one query per batch and model.
+
+    def resolve(self, model, records, key):
+        ids = set()
+        names = set()
+        for record in records:
+            if record.get(key + '_id'):
+                ids.add(int(record[key + '_id']))
+            elif record.get(key + '_name'):
+                names.add(record[key + '_name'])
+
+        known = set()
+        if ids:
+            known = set(row.id for row in db.session.query(model.id).filter(model.id.in_(ids)))
+        by_name = {}
+        if names:
+            for row in db.session.query(model.id, model.name).filter(model.name.in_(names)):
+                by_name[row.name] = None if row.name in by_name else row.id
+        return known, by_name
+
+    def clean(self, batch):
+        rows = []
+        rejected = []
+        for line, row in batch:
+            if not isinstance(row, dict):
+                rejected.append((line, ['expected an object']))
+                continue
+            row = dict(row)
+            errors = self.rules.clean(row)
+            for key in ('venue', 'artist'):
+                if not row.get(key + '_id') and not row.get(key + '_name'):
+                    errors.append('%s_id or %s_name is required' % (key, key))
+                elif row.get(key + '_id') and not str(row[key + '_id']).isdigit():
+                    errors.append('%s_id: not an integer' % key)
+                elif not row.get(key + '_id') and not isinstance(row[key + '_name'], str):
+                    errors.append('%s_name: expected a string' % key)
+            if errors:
+                rejected.append((line, errors))
+            else:
+                rows.append((line, row))
+
+        venue_ids, venues_by_name = self.resolve(Venue, [row for _, row in rows], 'venue')
+        artist_ids, artists_by_name = self.resolve(Artist, [row for _, row in rows], 'artist')
+
+        records = []
+        for line, row in rows:
+            record = {'start_time': row['start_time']}
+            errors = []
+            for key, ids, by_name in (('venue', venue_ids, venues_by_name), ('artist', artist_ids, artists_by_name)):
+                if row.get(key + '_id'):
+                    record[key + '_id'] = int(row[key + '_id'])
+                    if record[key + '_id'] not in ids:
+                        errors.append('%s_id %s does not exist' % (key, row[key + '_id']))
+                else:
+                    record[key + '_id'] = by_name.get(row[key + '_name'])
+                    if record[key + '_id'] is None:
+                        errors.append('%s_name %r is unknown or ambiguous' % (key, row[key + '_name']))
+            if errors:
+                rejected.append((line, errors))
+            else:
+                records.append(record)
+        return records, rejected
+
+
+KINDS = {
+    'venues': Kind(Venue, VenueForm,
+                   ('name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'website',
+                    'facebook_link', 'seeking_talent', 'seeking_description'),
+                   booleans=('seeking_talent',)),
+    'artists': Kind(Artist, ArtistForm,
+                    ('name', 'city', 'state', 'phone', 'genres', 'image_link', 'website', 'facebook_link',
+                     'seeking_venue', 'seeking_description'),
+                    booleans=('seeking_venue',)),
+    'shows': ShowKind(Show, ShowForm, ('venue_id', 'artist_id', 'start_time')),
+}
+
+
+# ----------------------------------------------------------------------------#
+# Loading.
+# ----------------------------------------------------------------------------#
+
+def copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        return '{' + ','.join('"%s"' % v.replace('\\', '\\\\').replace('"', '\\"') for v in value) + '}'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def load_copy(connection, table, columns, records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow([copy_value(record[column]) for column in columns])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert('COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (table, ', '.join(columns)), buffer)
+
+
+def load_executemany(connection, table, columns, records):
+    connection.execute(table.insert(), records)
+
+
+def import_rows(kind_name, rows, batch_size=5000, method='copy', on_reject=None):
+    # Validates and loads rows batch by batch, one transaction per batch;
+    # show batches also recount the counters of the venues and artists
+    # they touch, and the area summary is rebuilt once at the end for
+    # venues and shows. Returns (loaded, rejected, seconds).
+    kind = KINDS[kind_name]
+    table = kind.model.__table__
+    columns = list(kind.columns)
+    loaded = rejected = 0
+    started = time.monotonic()
+
+    for batch in batches(enumerate(rows, 1), batch_size):
+        records, errors = kind.clean(batch)
+        rejected += len(errors)
+        if on_reject:
+            for line, messages in errors:
+                on_reject(line, messages)
+        if not records:
+            continue
+
+        connection = db.session.connection()
+        if method == 'copy':
+            load_copy(connection, table.name, columns, records)
+        else:
+            load_executemany(connection, table, columns, records)
+        if kind_name == 'shows':
+            refresh_show_counters(Venue, Show.venue_id, ids=set(r['venue_id'] for r in records))
+            refresh_show_counters(Artist, Show.artist_id, ids=set(r['artist_id'] for r in records))
+        db.session.commit()
+        loaded += len(records)
+
+    if loaded and kind_name in ('venues', 'shows'):
+        refresh_areas()
+        db.session.commit()
+    return loaded, rejected, time.monotonic() - started
@@ -0,0 +1,91 @@
+import logging
+import re
+import time
+from collections import Counter
+from flask import g, has_request_context, request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('fyyur.sql')
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\b\d+\b|'(?:[^']|'')*'")
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def repeated(self, threshold):
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+def statement_shape(statement):
+    # Collapses parameters, literals and IN lists so that the same query
+    # issued for different rows has the same shape.
+    shape = _PLACEHOLDER_LIST.sub('?', _PLACEHOLDER.sub('?', statement))
+    return ' '.join(shape.split())
+
+
+def query_budget(limit):
+    # Maximum number of queries a view may issue; enforced in SQL_STRICT mode.
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # The start time lives on the execution context, which is dropped with
+    # the statement whether it succeeds or raises. Statements run with the
+    # execution option instrumented=False (housekeeping such as the replica
+    # lag check) do not count towards the request's queries.
+    if has_request_context() and context is not None and context.execution_options.get('instrumented', True):
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if not has_request_context() or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = g.get('sql_stats')
+    if stats is None:
+        stats = g.sql_stats = RequestStats()
+    stats.count += 1
+    stats.seconds += elapsed
+    stats.shapes[statement_shape(statement)] += 1
+
+
+def _report(response):
+    # Streamed responses keep querying after this runs; only the queries
+    # issued before the first byte are reported for them.
+    stats = g.pop('sql_stats', None) or RequestStats()
+    config = current_app.config
+    repeated = stats.repeated(config['SQL_REPEAT_THRESHOLD'])
+
+    response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries"' % (stats.seconds * 1000, stats.count))
+    logger.info('%s %s queries=%d db_ms=%.2f%s', request.method, request.full_path.rstrip('?'), stats.count,
+                stats.seconds * 1000, ''.join(' repeated=%dx %s' % (n, shape) for shape, n in repeated))
+
+    if config['SQL_STRICT']:
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', config['SQL_QUERY_BUDGET'])
+        if budget is not None and stats.count > budget:
+            raise QueryBudgetExceeded('%s issued %d queries, budget is %d' % (request.endpoint, stats.count, budget))
+        if repeated:
+            raise QueryBudgetExceeded('%s repeated %dx: %s' % (request.endpoint, repeated[0][1], repeated[0][0]))
+    return response
+
+
+def init_app(app):
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.after_request(_report)
@@ -0,0 +1,30 @@
+"""GIN indexes on venue and artist genres
+
+Revision ID: 17f0cc2f50f4
+Revises: 2a9f0d8ca5b1
+Create Date: 2026-10-18 15:48:12.630417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '17f0cc2f50f4'
+down_revision = '2a9f0d8ca5b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built CONCURRENTLY like the lookup indexes in 2a9f0d8ca5b1.
+    with op.get_context().autocommit_block():
+        for table in ('venues', 'artists'):
+            op.create_index('ix_%s_genres' % table, table, ['genres'], unique=False, if_not_exists=True,
+                            postgresql_using='gin', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in ('artists', 'venues'):
+            op.drop_index('ix_%s_genres' % table, table_name=table, if_exists=True, postgresql_concurrently=True)
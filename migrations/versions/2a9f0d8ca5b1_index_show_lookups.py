@@ -0,0 +1,40 @@
+"""covering indexes for show lookups and venue areas
+
+Revision ID: 2a9f0d8ca5b1
+Revises: af47cb9bc96a
+Create Date: 2026-10-18 15:02:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a9f0d8ca5b1'
+down_revision = 'af47cb9bc96a'
+branch_labels = None
+depends_on = None
+
+# name, table, columns, included columns
+INDEXES = (
+    ('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], ['artist_id']),
+    ('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], ['venue_id']),
+    ('ix_shows_start_time_id', 'shows', ['start_time', 'id'], []),
+    ('ix_venues_city_state', 'venues', ['city', 'state'], ['id', 'name', 'upcoming_shows_count']),
+)
+
+
+def upgrade():
+    # CONCURRENTLY builds without locking out writes but cannot run inside a
+    # transaction. A build that fails leaves an INVALID index behind; drop
+    # it before running the migration again.
+    with op.get_context().autocommit_block():
+        for name, table, columns, include in INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_include=include, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, include in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
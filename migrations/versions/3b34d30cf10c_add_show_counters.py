@@ -0,0 +1,38 @@
+"""add upcoming/past show counters to venues and artists
+
+Revision ID: 3b34d30cf10c
+Revises: 743a9e6bb565
+Create Date: 2026-10-18 11:02:17.550931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b34d30cf10c'
+down_revision = '743a9e6bb565'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL = """
+UPDATE {table} SET
+    upcoming_shows_count = (SELECT count(*) FROM shows
+                            WHERE shows.{column} = {table}.id AND shows.start_time >= now() at time zone 'utc'),
+    past_shows_count = (SELECT count(*) FROM shows
+                        WHERE shows.{column} = {table}.id AND shows.start_time < now() at time zone 'utc')
+"""
+
+
+def upgrade():
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(BACKFILL.format(table=table, column=column))
+
+
+def downgrade():
+    for table in ('venues', 'artists'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,55 @@
+"""add full-text search vectors to venues and artists
+
+Revision ID: 743a9e6bb565
+Revises: 4a5a64742961
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '743a9e6bb565'
+down_revision = '4a5a64742961'
+branch_labels = None
+depends_on = None
+
+
+# name weighs more than location, location more than genres
+SEARCH_VECTOR_FUNCTION = """
+CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(array_to_string(NEW.genres, ' '), '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+SEARCH_VECTOR_TRIGGER = """
+CREATE TRIGGER {table}_search_vector_trigger
+BEFORE INSERT OR UPDATE OF name, city, state, genres ON {table}
+FOR EACH ROW EXECUTE PROCEDURE {table}_search_vector_update();
+"""
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute(SEARCH_VECTOR_FUNCTION.format(table=table))
+        op.execute(SEARCH_VECTOR_TRIGGER.format(table=table))
+        # fire the trigger once for existing rows
+        op.execute('UPDATE {table} SET name = name'.format(table=table))
+        op.create_index('ix_{table}_search_vector'.format(table=table), table, ['search_vector'],
+                        unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('venues', 'artists'):
+        op.drop_index('ix_{table}_search_vector'.format(table=table), table_name=table)
+        op.execute('DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table}'.format(table=table))
+        op.execute('DROP FUNCTION IF EXISTS {table}_search_vector_update()'.format(table=table))
+        op.drop_column(table, 'search_vector')
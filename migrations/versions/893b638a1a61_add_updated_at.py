@@ -0,0 +1,27 @@
+"""add updated_at to venues, artists and shows
+
+Revision ID: 893b638a1a61
+Revises: 3b34d30cf10c
+Create Date: 2026-10-18 11:48:05.102377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '893b638a1a61'
+down_revision = '3b34d30cf10c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists', 'shows'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                       server_default=sa.text("(now() at time zone 'utc')")))
+
+
+def downgrade():
+    for table in ('venues', 'artists', 'shows'):
+        op.drop_column(table, 'updated_at')
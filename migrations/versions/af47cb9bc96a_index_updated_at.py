@@ -0,0 +1,34 @@
+"""index updated_at for incremental exports
+
+Revision ID: af47cb9bc96a
+Revises: 893b638a1a61
+Create Date: 2026-10-18 13:20:44.918372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'af47cb9bc96a'
+down_revision = '893b638a1a61'
+branch_labels = None
+depends_on = None
+
+TABLES = ('artists', 'shows', 'venues')
+
+
+def upgrade():
+    # Built CONCURRENTLY so writes to the tables go on meanwhile; see
+    # 2a9f0d8ca5b1 for what to do when a build fails.
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index('ix_%s_updated_at' % table, table, ['updated_at'], unique=False, if_not_exists=True,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in reversed(TABLES):
+            op.drop_index('ix_%s_updated_at' % table, table_name=table, if_exists=True,
+                          postgresql_concurrently=True)
@@ -0,0 +1,42 @@
+"""add areas summary of venues by city and state
+
+Revision ID: cd077db08053
+Revises: 17f0cc2f50f4
+Create Date: 2026-10-18 16:31:09.274815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd077db08053'
+down_revision = '17f0cc2f50f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('areas',
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('venue_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('venues', sa.JSON(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('city', 'state')
+    )
+    # Same rows as queries.refresh_areas().
+    op.execute("""
+        INSERT INTO areas (city, state, venue_count, upcoming_shows_count, venues, updated_at)
+        SELECT city, state, count(id), coalesce(sum(upcoming_shows_count), 0),
+               json_agg(json_build_object('id', id, 'name', name) ORDER BY name),
+               now() at time zone 'utc'
+        FROM venues
+        WHERE city IS NOT NULL AND state IS NOT NULL
+        GROUP BY city, state
+    """)
+
+
+def downgrade():
+    op.drop_table('areas')
@@ -0,0 +1,117 @@
+from datetime import datetime
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={
+
+    'class_': RoutingSession,
+    'expire_on_commit': False
+
+})
+
+
+class Show(db.Model):
+    __tablename__ = 'shows'
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text("(now() at time zone 'utc')"), index=True)
+
+    # Timelines and counters look shows up by venue or artist and start time;
+    # the feed pages through (start_time, id).
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time', postgresql_include=['artist_id']),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time', postgresql_include=['venue_id']),
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<Show {self.id} {self.start_time}>'
+
+
+class Venue(db.Model):
+    __tablename__ = 'venues'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    genres = db.Column(ARRAY(db.String))
+    image_link = db.Column(db.String(500))
+    website = db.Column(db.String(120))
+    facebook_link = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(500))
+    # maintained by create_show_submission and the roll-shows command
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text("(now() at time zone 'utc')"), index=True)
+    # maintained by the venues_search_vector_update trigger
+    search_vector = db.Column(TSVECTOR)
+    shows = db.relationship('Show', backref='venue', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_venues_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venues_city_state', 'city', 'state', postgresql_include=['id', 'name', 'upcoming_shows_count']),
+    )
+
+    def __repr__(self):
+        return f'<Venue {self.id} {self.name}>'
+
+
+class Artist(db.Model):
+    __tablename__ = 'artists'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    genres = db.Column(ARRAY(db.String))
+    image_link = db.Column(db.String(500))
+    website = db.Column(db.String(120))
+    facebook_link = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(500))
+    # maintained by create_show_submission and the roll-shows command
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text("(now() at time zone 'utc')"), index=True)
+    # maintained by the artists_search_vector_update trigger
+    search_vector = db.Column(TSVECTOR)
+    shows = db.relationship('Show', backref='artist', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_artists_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+    )
+
+    def __repr__(self):
+        return f'<Artist {self.id} {self.name}>'
+
+
+class Area(db.Model):
+    # Summary of the venues of one city/state, read by /venues. Rebuilt by
+    # refresh_areas (on venue changes, imports and the refresh-areas
+    # command); upcoming_shows_count is also bumped by create_show_submission.
+    __tablename__ = 'areas'
+
+    city = db.Column(db.String(120), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    venue_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # [{"id": ..., "name": ...}] ordered by name
+    venues = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Area {self.city}, {self.state}>'
@@ -0,0 +1,403 @@
+import re
+from datetime import datetime
+from flask import abort, current_app
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from models import db, Show, Venue, Artist, Area
+from formatting import parse_datetime
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+
+def bump_show_counters(venue_id, artist_id, start_time):
+    # Called inside the transaction that inserts the show.
+    key = 'upcoming_shows_count' if start_time >= datetime.utcnow() else 'past_shows_count'
+    for model, subject_id in ((Venue, venue_id), (Artist, artist_id)):
+        column = getattr(model, key)
+        model.query.filter(model.id == subject_id) \
+            .update({column: column + 1}, synchronize_session=False)
+    if key == 'upcoming_shows_count':
+        area = db.session.query(Venue.city, Venue.state).filter(Venue.id == venue_id).first()
+        if area is None:
+            return
+        # Under the same lock as refresh_areas, whose upsert of totals read
+        # before this show commits would otherwise overwrite the +1.
+        lock_areas([tuple(area)])
+        Area.query.filter(Area.city == area.city, Area.state == area.state) \
+            .update({Area.upcoming_shows_count: Area.upcoming_shows_count + 1}, synchronize_session=False)
+
+
+def refresh_show_counters(model, subject_column, since=None, ids=None):
+    # Recounts upcoming/past shows. With `since`, only subjects that had a
+    # show start between `since` and now are touched, which is what rolls
+    # shows over from upcoming to past as time passes. With `ids`, only
+    # those subjects are recounted.
+    now = datetime.utcnow()
+
+    def count(*criteria):
+        return db.session.query(func.count(Show.id)) \
+            .filter(subject_column == model.id, *criteria) \
+            .scalar_subquery()
+
+    query = model.query
+    if since is not None:
+        rolled = db.session.query(subject_column) \
+            .filter(Show.start_time >= since, Show.start_time < now)
+        query = query.filter(model.id.in_(rolled))
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+
+    return query.update({
+        model.upcoming_shows_count: count(Show.start_time >= now),
+        model.past_shows_count: count(Show.start_time < now)
+    }, synchronize_session=False)
+
+
+# ----------------------------------------------------------------------------#
+# Show timeline.
+# ----------------------------------------------------------------------------#
+
+def show_timeline_query(subject_column, subject_id, counterpart, counterpart_column):
+    return db.session.query(
+        Show.start_time,
+        counterpart.id,
+        counterpart.name,
+        counterpart.image_link
+    ).join(counterpart, counterpart.id == counterpart_column) \
+        .filter(subject_column == subject_id) \
+        .order_by(Show.start_time)
+
+
+def page_validator_query(subject_column, subject_id, counterpart, counterpart_column):
+    # A detail page changes when the subject, one of its shows or a show's
+    # counterpart is updated, when a show is added or removed, and when a
+    # show starts and moves from upcoming to past. One aggregate query over
+    # the subject's shows covers all of it.
+    now = datetime.utcnow()
+    return db.session.query(
+        func.max(func.greatest(Show.updated_at, counterpart.updated_at)).label('updated_at'),
+        func.max(Show.start_time).filter(Show.start_time < now).label('last_started'),
+        func.count(Show.id).label('show_count')
+    ).join(counterpart, counterpart.id == counterpart_column) \
+        .filter(subject_column == subject_id)
+
+
+def split_timeline(rows, prefix):
+    # Splits the rows of show_timeline_query into past/upcoming in one pass.
+    now = datetime.utcnow()
+    timeline = {'past_shows': [], 'upcoming_shows': []}
+    for row in rows:
+        key = 'upcoming_shows' if row.start_time >= now else 'past_shows'
+        timeline[key].append({
+            prefix + '_id': row.id,
+            prefix + '_name': row.name,
+            prefix + '_image_link': row.image_link,
+            'start_time': row.start_time,
+        })
+
+    timeline['past_shows_count'] = len(timeline['past_shows'])
+    timeline['upcoming_shows_count'] = len(timeline['upcoming_shows'])
+    return timeline
+
+
+def show_timeline(subject_column, subject_id, counterpart, counterpart_column, prefix):
+    # Fetches every show of a venue or artist with its counterpart joined in.
+    rows = show_timeline_query(subject_column, subject_id, counterpart, counterpart_column).all()
+    return split_timeline(rows, prefix)
+
+
+def venue_timeline(venue_id):
+    return show_timeline(Show.venue_id, venue_id, Artist, Show.artist_id, 'artist')
+
+
+def artist_timeline(artist_id):
+    return show_timeline(Show.artist_id, artist_id, Venue, Show.venue_id, 'venue')
+
+
+# ----------------------------------------------------------------------------#
+# Venue areas.
+# ----------------------------------------------------------------------------#
+
+def venue_areas_query(filters=None):
+    # One grouped query over venues: one row per city/state with its venue
+    # count, upcoming-show total and venues aggregated as JSON. The area
+    # summary is built from it; the listing only runs it directly for genre
+    # filters, which the summary cannot answer.
+    venue_json = func.json_build_object(
+        'id', Venue.id,
+        'name', Venue.name
+    )
+
+    return db.session.query(
+        Venue.city,
+        Venue.state,
+        func.count(Venue.id).label('venue_count'),
+        func.coalesce(func.sum(Venue.upcoming_shows_count), 0).label('upcoming_shows_count'),
+        func.json_agg(aggregate_order_by(venue_json, Venue.name)).label('venues')
+    ).filter(*filter_criteria(Venue, filters)) \
+        .group_by(Venue.city, Venue.state) \
+        .order_by(Venue.city, Venue.state)
+
+
+def areas_query(filters=None):
+    if filters and filters.get('genre'):
+        return venue_areas_query(filters)
+    return db.session.query(
+        Area.city,
+        Area.state,
+        Area.venue_count,
+        Area.upcoming_shows_count,
+        Area.venues
+    ).filter(*filter_criteria(Area, filters)) \
+        .order_by(Area.city, Area.state)
+
+
+def area_data(row):
+    return {
+        "city": row.city,
+        "state": row.state,
+        "venue_count": row.venue_count,
+        "upcoming_shows_count": row.upcoming_shows_count,
+        "venues": row.venues
+    }
+
+
+def venue_areas(filters=None):
+    return [area_data(row) for row in areas_query(filters).all()]
+
+
+def iter_venue_areas(filters=None, batch_size=None):
+    # Streams areas off a server-side cursor, batch_size rows at a time.
+    batch_size = batch_size or current_app.config['STREAM_BATCH_SIZE']
+    for row in areas_query(filters).yield_per(batch_size):
+        yield area_data(row)
+
+
+def lock_areas(areas=None):
+    # Transaction-level advisory locks serializing refresh_areas: a shared
+    # lock on all areas plus one per area for the given (city, state)
+    # pairs, taken in sorted order; an exclusive lock on all areas for a
+    # full rebuild. Two transactions that changed venues of one area would
+    # otherwise each count without the other's uncommitted venue, and the
+    # one committing last would leave its count in the summary.
+    # bump_show_counters takes the same locks.
+    if areas is None:
+        db.session.execute(select(func.pg_advisory_xact_lock(func.hashtext('areas'))))
+        return
+    db.session.execute(select(func.pg_advisory_xact_lock_shared(func.hashtext('areas'))))
+    for city, state in sorted(area for area in areas if None not in area):
+        db.session.execute(select(func.pg_advisory_xact_lock(func.hashtext('area:%s,%s' % (city, state)))))
+
+
+def refresh_areas(areas=None):
+    # Rebuilds the summary rows of the given (city, state) pairs, or of
+    # every area, from venues. Rows are upserted and areas left without
+    # venues deleted in the caller's transaction, so readers keep seeing the
+    # previous summary until it commits rather than an empty table.
+    db.session.flush()
+    live = venue_areas_query().filter(Venue.city.isnot(None), Venue.state.isnot(None))
+    stale = Area.query.filter(~db.session.query(Venue.id)
+                              .filter(Venue.city == Area.city, Venue.state == Area.state)
+                              .exists())
+    if areas is not None:
+        areas = list(set(areas))
+        if not areas:
+            return
+        live = live.filter(tuple_(Venue.city, Venue.state).in_(areas))
+        stale = stale.filter(tuple_(Area.city, Area.state).in_(areas))
+    lock_areas(areas)
+
+    columns = ['city', 'state', 'venue_count', 'upcoming_shows_count', 'venues', 'updated_at']
+    upsert = insert(Area).from_select(columns, live.add_columns(func.timezone('utc', func.now())).statement)
+    db.session.execute(upsert.on_conflict_do_update(
+        index_elements=['city', 'state'],
+        set_={column: upsert.excluded[column] for column in columns[2:]}
+    ))
+    stale.delete(synchronize_session=False)
+
+
+def refresh_area_totals():
+    # Recomputes only the upcoming-show totals, for the roll-shows job.
+    total = db.session.query(func.coalesce(func.sum(Venue.upcoming_shows_count), 0)) \
+        .filter(Venue.city == Area.city, Venue.state == Area.state) \
+        .scalar_subquery()
+    return Area.query.filter(Area.upcoming_shows_count != total) \
+        .update({Area.upcoming_shows_count: total}, synchronize_session=False)
+
+
+# ----------------------------------------------------------------------------#
+# Show feed.
+# ----------------------------------------------------------------------------#
+
+def encode_show_cursor(start_time, show_id):
+    return start_time.isoformat() + '_' + str(show_id)
+
+
+def decode_show_cursor(cursor):
+    try:
+        start_time, show_id = cursor.rsplit('_', 1)
+        return parse_datetime(start_time), int(show_id)
+    except (ValueError, OverflowError):
+        abort(400)
+
+
+def show_feed_query(cursor=None):
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Venue, Venue.id == Show.venue_id) \
+        .join(Artist, Artist.id == Show.artist_id)
+
+    if cursor:
+        query = query.filter(tuple_(Show.start_time, Show.id) > decode_show_cursor(cursor))
+
+    return query.order_by(Show.start_time, Show.id)
+
+
+def show_data(row):
+    return {
+        "venue_id": row.venue_id,
+        "venue_name": row.venue_name,
+        "artist_id": row.artist_id,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+        "start_time": row.start_time
+    }
+
+
+def show_feed_page(rows, per_page):
+    # `rows` is show_feed_query limited to per_page + 1; the extra row only
+    # tells whether there is a next page.
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_show_cursor(rows[-1].start_time, rows[-1].id)
+
+    return [show_data(row) for row in rows], next_cursor
+
+
+def show_feed(cursor=None, per_page=None):
+    # Keyset pagination over (start_time, id): every page is an index range
+    # scan from the cursor, so deep pages cost the same as the first one.
+    per_page = per_page or current_app.config['SHOWS_PER_PAGE']
+    return show_feed_page(show_feed_query(cursor).limit(per_page + 1).all(), per_page)
+
+
+class ShowFeedStream(object):
+    # The page show_feed returns, streamed off a server-side cursor. Its
+    # next_cursor is known once the rows have been iterated, which in a
+    # streamed template is before the pager after them is rendered.
+
+    def __init__(self, cursor=None, per_page=None, batch_size=None):
+        self.cursor = cursor
+        self.per_page = per_page or current_app.config['SHOWS_PER_PAGE']
+        self.batch_size = batch_size or current_app.config['STREAM_BATCH_SIZE']
+        self.next_cursor = None
+
+    def __iter__(self):
+        query = show_feed_query(self.cursor).limit(self.per_page + 1).yield_per(self.batch_size)
+        last = None
+        for n, row in enumerate(query):
+            if n < self.per_page:
+                last = row
+                yield show_data(row)
+            else:
+                self.next_cursor = encode_show_cursor(last.start_time, last.id)
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+def search_query(term):
+    # Every word of the search term becomes a prefix match, so partial names
+    # keep matching the way the old ILIKE search did.
+    words = re.findall(r'[^\W_]+', term or '')
+    if not words:
+        return None
+    return func.to_tsquery('simple', ' & '.join(word + ':*' for word in words))
+
+
+def search_results_query(model, term, filters=None):
+    # Ranked full-text search over the GIN-indexed search_vector of a model;
+    # an empty term lists everything by name.
+    query = db.session.query(
+        model.id,
+        model.name,
+        model.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(*filter_criteria(model, filters))
+
+    tsquery = search_query(term)
+    if tsquery is None:
+        return query.order_by(model.name)
+
+    return query.filter(model.search_vector.op('@@')(tsquery)) \
+        .order_by(func.ts_rank(model.search_vector, tsquery).desc(), model.name)
+
+
+def search(model, term, filters=None):
+    return search_results_query(model, term, filters).all()
+
+
+# ----------------------------------------------------------------------------#
+# Filters and facets.
+# ----------------------------------------------------------------------------#
+
+def filter_criteria(model, filters=None, term=None):
+    # `filters` as parsed from the request: a list of genres that must all
+    # be present (array containment, served by the GIN index on genres) and
+    # an optional city and state.
+    filters = filters or {}
+    criteria = []
+    if filters.get('genre'):
+        criteria.append(model.genres.contains(filters['genre']))
+    if filters.get('city'):
+        criteria.append(model.city == filters['city'])
+    if filters.get('state'):
+        criteria.append(model.state == filters['state'])
+    tsquery = search_query(term)
+    if tsquery is not None:
+        criteria.append(model.search_vector.op('@@')(tsquery))
+    return criteria
+
+
+def facets_query(model, filters=None, term=None):
+    # Per-genre and per-city/state counts of the rows matching the filters
+    # and search term, as two JSON arrays from a single statement.
+    criteria = filter_criteria(model, filters, term)
+    empty = db.literal_column("'[]'::json")
+
+    tagged = db.session.query(func.unnest(model.genres).label('genre')).filter(*criteria).subquery()
+    genre_counts = db.session.query(tagged.c.genre, func.count().label('count')) \
+        .group_by(tagged.c.genre) \
+        .subquery()
+    area_counts = db.session.query(model.city, model.state, func.count().label('count')) \
+        .filter(*criteria) \
+        .group_by(model.city, model.state) \
+        .subquery()
+
+    genre_json = func.json_build_object('genre', genre_counts.c.genre, 'count', genre_counts.c.count)
+    area_json = func.json_build_object('city', area_counts.c.city, 'state', area_counts.c.state,
+                                       'count', area_counts.c.count)
+    return db.session.query(
+        db.session.query(func.coalesce(func.json_agg(aggregate_order_by(
+            genre_json, genre_counts.c.count.desc(), genre_counts.c.genre)), empty)).scalar_subquery().label('genres'),
+        db.session.query(func.coalesce(func.json_agg(aggregate_order_by(
+            area_json, area_counts.c.count.desc(), area_counts.c.city, area_counts.c.state)), empty))
+        .scalar_subquery().label('areas')
+    )
+
+
+def facet_data(row):
+    return {'genres': row.genres, 'areas': row.areas}
+
+
+def facets(model, filters=None, term=None):
+    return facet_data(facets_query(model, filters, term).one())
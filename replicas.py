@@ -0,0 +1,125 @@
+import itertools
+import logging
+import threading
+import time
+from flask import g, has_app_context, has_request_context, request, session, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.expression import UpdateBase
+
+logger = logging.getLogger('fyyur.replicas')
+
+# Seconds the replica is behind the primary; 0 when it has replayed
+# everything it received, or when it is not a standby at all.
+LAG_QUERY = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+
+def read_only(view):
+    # Marks a view whose queries may be served by a replica.
+    view.read_only = True
+    return view
+
+
+class ReplicaSet(object):
+    # Replica bind keys and their last measured lag. One thread per worker
+    # re-measures the lag every `check_interval` seconds while the others
+    # keep using the previous figures; a replica that is more than `max_lag`
+    # seconds behind, or could not be reached, is skipped until the next
+    # check.
+
+    def __init__(self, keys, max_lag=5, check_interval=5):
+        self.keys = list(keys)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lag = {}
+        self._checked = None
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+
+    def check(self, engines):
+        for key in self.keys:
+            try:
+                with engines[key].connect() as connection:
+                    # Not one of the request's queries (see instrumentation).
+                    connection.execution_options(instrumented=False)
+                    self._lag[key] = float(connection.execute(LAG_QUERY).scalar())
+            except DBAPIError as e:
+                self._lag[key] = None
+                logger.warning('Replica %s unavailable: %s', key, e.orig)
+            else:
+                if self._lag[key] > self.max_lag:
+                    logger.warning('Replica %s is %.1fs behind', key, self._lag[key])
+        self._checked = time.monotonic()
+
+    def due(self):
+        return self._checked is None or time.monotonic() - self._checked >= self.check_interval
+
+    def healthy(self, engines):
+        if self.due() and self._lock.acquire(blocking=False):
+            try:
+                self.check(engines)
+            finally:
+                self._lock.release()
+        return [key for key in self.keys if self._lag.get(key) is not None and self._lag[key] <= self.max_lag]
+
+    def pick(self, engines):
+        # Round-robin over the healthy replicas; None means use the primary.
+        healthy = self.healthy(engines)
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+
+class RoutingSession(Session):
+    # Sends the queries of a request routed to a replica (g.db_replica) to
+    # that replica. Flushes and INSERT/UPDATE/DELETE statements always go to
+    # the primary and mark the request as having written.
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and (self._flushing or isinstance(clause, UpdateBase)):
+            if has_request_context():
+                g.db_wrote = True
+        elif bind is None and has_app_context() and g.get('db_replica'):
+            return self._db.engines[g.db_replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def reads_primary():
+    # Clients that wrote in the last REPLICA_STICKY_SECONDS read from the
+    # primary so they see their own changes; caches must not hide them.
+    return session.get('db_primary_until', 0) > time.time()
+
+
+def may_cache(invalidated_at):
+    # Whether what this request read may be cached, given when the cache
+    # was last invalidated: a replica may not have replayed that write for
+    # up to REPLICA_MAX_LAG seconds, and a stale copy cached under the new
+    # generation would be served to everyone until it expires.
+    return not g.get('db_replica') or time.time() - invalidated_at >= current_app.config['REPLICA_MAX_LAG']
+
+
+def _route():
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, 'read_only', False) or reads_primary():
+        return
+    engines = current_app.extensions['sqlalchemy'].engines
+    g.db_replica = current_app.extensions['replicas'].pick(engines)
+
+
+def _stick(response):
+    if g.pop('db_wrote', False):
+        session['db_primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+    return response
+
+
+def init_app(app):
+    keys = sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {} if key.startswith('replica'))
+    if not keys:
+        return
+    app.extensions['replicas'] = ReplicaSet(keys, app.config['REPLICA_MAX_LAG'], app.config['REPLICA_CHECK_INTERVAL'])
+    app.before_request(_route)
+    app.after_request(_stick)
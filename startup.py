@@ -0,0 +1,84 @@
+# ----------------------------------------------------------------------------#
+# Startup profile.
+#
+#     python app.py --profile-startup [--modules] [--limit 25]
+#
+# Boots the app in fresh interpreters the way a server worker does (import
+# app, create_app()) under `python -X importtime` and reports how long the
+# boot took and which packages, or modules, the import time went to.
+# ----------------------------------------------------------------------------#
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+MARKER = '-- boot'
+BOOT = '''
+import sys, time
+sys.stderr.write(%r + "\\n")
+started = time.perf_counter()
+from app import create_app
+create_app()
+print(time.perf_counter() - started)
+''' % MARKER
+
+
+def parse_importtime(output):
+    # [(name, depth, self_us, cumulative_us)] for the modules imported after
+    # the marker, in the order -X importtime reports them (children first).
+    modules = []
+    lines = output.splitlines()
+    for line in lines[lines.index(MARKER) + 1:]:
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), (len(name) - len(name.lstrip()) - 1) // 2,
+                        int(self_us), int(cumulative_us)))
+    return modules
+
+
+def boot(directory):
+    # Seconds create_app() took from a cold interpreter, and its imports.
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT], cwd=directory,
+                            capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(result.stderr)
+    return float(result.stdout.split()[-1]), parse_importtime(result.stderr)
+
+
+def packages(modules):
+    # Self time and module count per top-level package.
+    totals = defaultdict(lambda: [0, 0])
+    for name, depth, self_us, cumulative_us in modules:
+        total = totals[name.split('.')[0]]
+        total[0] += self_us
+        total[1] += 1
+    return sorted(((name, us, count) for name, (us, count) in totals.items()), key=lambda t: -t[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='app.py --profile-startup',
+                                     description='Report where the boot time of a worker goes.')
+    parser.add_argument('--profile-startup', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--runs', type=int, default=3, help='boots to run; the fastest is reported')
+    parser.add_argument('--limit', type=int, default=25, help='rows to print')
+    parser.add_argument('--modules', action='store_true', help='list single modules instead of packages')
+    args = parser.parse_args(argv)
+
+    directory = os.path.dirname(os.path.abspath(__file__))
+    seconds, modules = min((boot(directory) for _ in range(args.runs)), key=lambda run: run[0])
+    imported = sum(self_us for name, depth, self_us, cumulative_us in modules)
+    print('create_app() from a cold interpreter: %.0f ms, %.0f ms of it importing %d modules'
+          % (seconds * 1000, imported / 1000, len(modules)))
+    print()
+
+    if args.modules:
+        print('%9s %11s  %s' % ('self ms', 'cumul. ms', 'module'))
+        for name, depth, self_us, cumulative_us in sorted(modules, key=lambda m: -m[2])[:args.limit]:
+            print('%9.1f %11.1f  %s' % (self_us / 1000, cumulative_us / 1000, name))
+    else:
+        print('%9s %6s  %s' % ('self ms', 'share', 'package (modules)'))
+        for name, us, count in packages(modules)[:args.limit]:
+            print('%9.1f %5.1f%%  %s (%d)' % (us / 1000, 100.0 * us / imported, name, count))
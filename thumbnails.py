@@ -0,0 +1,327 @@
+import functools
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from flask import current_app, request, abort, redirect, send_file, url_for
+import images
+from cache import DiskLRUCache, LRUCache, Coalescer
+from models import db, Venue, Artist
+from replicas import read_only
+
+logger = logging.getLogger('fyyur.thumbnails')
+
+KINDS = {'venues': Venue, 'artists': Artist}
+CHUNK_BYTES = 64 * 1024
+
+
+class FetchError(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------------#
+# Fetching.
+# ----------------------------------------------------------------------------#
+
+def check_url(url):
+    # image_link is whatever a visitor typed, so the server only fetches
+    # http(s) URLs, and only from hosts on the public internet: see
+    # resolve, which the connections below go through.
+    try:
+        parts = urllib.parse.urlsplit(url)
+        parts.port
+    except ValueError as error:
+        raise FetchError('invalid URL: %s' % error)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise FetchError('not an http(s) URL')
+
+
+def resolve(host, port, allow_private=False):
+    # getaddrinfo() of the host, refused unless every address is public.
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as error:
+        raise FetchError('cannot resolve %s: %s' % (host, error))
+    if not allow_private:
+        for family, kind, proto, canonname, sockaddr in addresses:
+            if not ipaddress.ip_address(sockaddr[0]).is_global:
+                raise FetchError('%s is not a public address' % sockaddr[0])
+    return addresses
+
+
+class Deadline(object):
+    # Overall time limit of a fetch. Socket timeouts only bound each read,
+    # so a source sending a byte every few seconds could hold a request
+    # thread for hours; when the time is up, the socket being read is shut
+    # down, which ends any read still waiting on it.
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.end = time.monotonic() + seconds
+        self._timer = None
+
+    def remaining(self):
+        remaining = self.end - time.monotonic()
+        if remaining <= 0:
+            raise FetchError('took longer than %g seconds' % self.seconds)
+        return remaining
+
+    def watch(self, sock):
+        self.cancel()
+        self._timer = threading.Timer(self.remaining(), self._expire, (sock,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def _expire(self, sock):
+        # The plain socket's shutdown, which leaves the TLS state alone.
+        try:
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class CheckedConnection(object):
+    # Connects to the very addresses resolve() checked instead of letting
+    # the socket look the host up again, which a host could answer with a
+    # private address the second time (DNS rebinding). The Host header and
+    # the TLS server name still carry the host name. Every connection of a
+    # fetch, redirects included, runs against the fetch's deadline.
+
+    def __init__(self, *args, allow_private=False, deadline=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.allow_private = allow_private
+        self.deadline = deadline
+        self._create_connection = self._connect_checked
+
+    def connect(self):
+        super().connect()
+        self.deadline.watch(self.sock)
+
+    def _connect_checked(self, address, timeout, source_address=None):
+        error = None
+        for family, kind, proto, canonname, sockaddr in resolve(*address, allow_private=self.allow_private):
+            sock = socket.socket(family, kind, proto)
+            try:
+                sock.settimeout(min(timeout, self.deadline.remaining()))
+                sock.connect(sockaddr)
+                return sock
+            except OSError as exc:
+                sock.close()
+                error = exc
+        raise error
+
+
+class CheckedHTTPConnection(CheckedConnection, http.client.HTTPConnection):
+    pass
+
+
+class CheckedHTTPSConnection(CheckedConnection, http.client.HTTPSConnection):
+    pass
+
+
+class CheckedHTTPHandler(urllib.request.HTTPHandler):
+
+    def __init__(self, options):
+        super().__init__()
+        self.options = options
+
+    def http_open(self, req):
+        return self.do_open(functools.partial(CheckedHTTPConnection, **self.options), req)
+
+
+class CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+
+    def __init__(self, options):
+        super().__init__()
+        self.options = options
+
+    def https_open(self, req):
+        return self.do_open(functools.partial(CheckedHTTPSConnection, **self.options), req, context=self._context)
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    # Applies check_url to every redirect target too.
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def fetch(url, timeout, max_bytes, allow_private=False):
+    # The body of `url`, fetched within `timeout` seconds in all.
+    check_url(url)
+    deadline = Deadline(timeout)
+    options = {'allow_private': allow_private, 'deadline': deadline}
+    # No proxies: the proxy would do the lookup the checks are about.
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), CheckedHTTPHandler(options),
+                                         CheckedHTTPSHandler(options), CheckedRedirectHandler())
+    req = urllib.request.Request(url, headers={'User-Agent': 'Fyyur thumbnails', 'Accept': 'image/*'})
+    data = bytearray()
+    try:
+        with opener.open(req, timeout=timeout) as response:
+            while len(data) <= max_bytes:
+                chunk = response.read(min(CHUNK_BYTES, max_bytes + 1 - len(data)))
+                if not chunk:
+                    break
+                data += chunk
+        # A shut-down socket reads as the end of the body.
+        deadline.remaining()
+    except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as error:
+        deadline.remaining()
+        raise FetchError(str(error))
+    finally:
+        deadline.cancel()
+    if len(data) > max_bytes:
+        raise FetchError('larger than %d bytes' % max_bytes)
+    return bytes(data)
+
+
+# ----------------------------------------------------------------------------#
+# Thumbnails.
+# ----------------------------------------------------------------------------#
+
+def link_version(link):
+    return hashlib.sha256(link.encode('utf-8')).hexdigest()[:10]
+
+
+class Thumbnails(object):
+    # Tile-sized variants of image links in a disk LRU. The first request
+    # for a link fetches it once and writes every width and format, while
+    # concurrent requests for the same link in this worker wait for that
+    # fetch instead of starting their own. A link that failed is not
+    # fetched again for `retry_after` seconds.
+
+    def __init__(self, config):
+        self.cache = DiskLRUCache(config['THUMBNAIL_CACHE_DIR'], config['THUMBNAIL_CACHE_BYTES'])
+        self.widths = config['THUMBNAIL_WIDTHS']
+        self.height_ratio = config['THUMBNAIL_HEIGHT_RATIO']
+        self.timeout = config['THUMBNAIL_FETCH_TIMEOUT']
+        self.max_bytes = config['THUMBNAIL_MAX_SOURCE_BYTES']
+        self.max_pixels = config['THUMBNAIL_MAX_SOURCE_PIXELS']
+        self.allow_private = config['THUMBNAIL_ALLOW_PRIVATE_HOSTS']
+        self.retry_after = config['THUMBNAIL_RETRY_AFTER']
+        self._formats = None
+        self._fetches = Coalescer()
+        self._failed = LRUCache(1024)
+
+    @property
+    def formats(self):
+        # Worked out on first use rather than in create_app(): it loads every
+        # Pillow plugin, which processes that never serve a thumbnail skip.
+        if self._formats is None:
+            self._formats = images.available_formats()
+        return self._formats
+
+    def key(self, link, width, fmt):
+        settings = sorted(dict(images.FORMATS)[fmt][2].items())
+        return hashlib.sha256(('%s %d %s %r %r' % (link, width, fmt, self.height_ratio, settings))
+                              .encode('utf-8')).hexdigest()
+
+    def get(self, link, width, fmt):
+        # Path or bytes of the thumbnail; raises FetchError.
+        key = self.key(link, width, fmt)
+        path = self.cache.get(key)
+        if path is not None:
+            return path
+        if self._failed.get(link):
+            raise FetchError('failed recently')
+        try:
+            made = self._fetches.run(link, lambda: self.make(link))
+        except FetchError:
+            self._failed.set(link, True, self.retry_after)
+            raise
+        return made[key]
+
+    def make(self, link):
+        # Fetches the link and writes all its thumbnails; {key: bytes}.
+        data = fetch(link, self.timeout, self.max_bytes, self.allow_private)
+        made = {}
+        try:
+            # Draft-decoded to no less than the widest tile on either side,
+            # whichever way round the EXIF orientation turns it.
+            largest = max(self.widths)
+            image = images.open_image(data, self.max_pixels, (largest, largest))
+            for width in self.widths:
+                scaled = images.fit(image, width, round(width * self.height_ratio))
+                for fmt in self.formats:
+                    made[self.key(link, width, fmt)] = images.encode(scaled, fmt)
+        except (OSError, ValueError, images.Image.DecompressionBombError) as error:
+            raise FetchError('not a usable image: %s' % error)
+        for key, thumbnail in made.items():
+            self.cache.set(key, thumbnail)
+        return made
+
+
+def thumbnail_set(kind, subject_id, link):
+    # The thumbnails of an image link for templates/layouts/images.html, in
+    # the same shape as assets.image_set; None without a link or Pillow.
+    thumbnails = current_app.extensions.get('thumbnails')
+    if not link or thumbnails is None:
+        return None
+    version = link_version(link)
+    sources = []
+    for fmt, (pil_format, mimetype, options) in images.FORMATS:
+        if fmt not in thumbnails.formats:
+            continue
+        urls = [(width, url_for('thumbnail', kind=kind, subject_id=subject_id, w=width, f=fmt, v=version))
+                for width in thumbnails.widths]
+        sources.append({
+            'type': mimetype,
+            'src': urls[-1][1],
+            'srcset': ', '.join('%s %dw' % (url, width) for width, url in urls)
+        })
+    return {'width': None, 'height': None, 'sources': sources}
+
+
+@read_only
+def send_thumbnail(kind, subject_id):
+    thumbnails = current_app.extensions.get('thumbnails')
+    model = KINDS.get(kind)
+    if model is None or thumbnails is None:
+        abort(404)
+    width = request.args.get('w', type=int)
+    fmt = request.args.get('f')
+    if width not in thumbnails.widths or fmt not in thumbnails.formats:
+        abort(404)
+    link = db.session.query(model.image_link).filter(model.id == subject_id).scalar()
+    if not link:
+        abort(404)
+    # Hand the connection back to the pool before a fetch that may take
+    # THUMBNAIL_FETCH_TIMEOUT seconds.
+    db.session.close()
+
+    try:
+        thumbnail = thumbnails.get(link, width, fmt)
+    except FetchError as error:
+        logger.warning('thumbnail of %s %d (%s): %s', kind, subject_id, link, error)
+        if link.startswith(('http://', 'https://')):
+            return redirect(link)
+        abort(404)
+
+    # URLs carry a version of the link they were rendered for, so a
+    # thumbnail can be cached for good unless the link changed since.
+    current = request.args.get('v') == link_version(link)
+    response = send_file(io.BytesIO(thumbnail) if isinstance(thumbnail, bytes) else thumbnail,
+                         mimetype=dict(images.FORMATS)[fmt][1], etag=thumbnails.key(link, width, fmt),
+                         max_age=current_app.config['THUMBNAIL_MAX_AGE'] if current else 60)
+    if current:
+        response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    if images.Image is not None:
+        app.extensions['thumbnails'] = Thumbnails(app.config)
+    app.add_url_rule('/img/<kind>/<int:subject_id>', 'thumbnail', send_thumbnail)
+    app.jinja_env.globals.update(thumbnail_set=thumbnail_set)
@@ -0,0 +1,101 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+
+class PrefixIndex(object):
+    # In-process prefix index over names, kept as a sorted array of
+    # (key, id) pairs. Every word of a name is a key, so "hop" finds
+    # "The Musical Hop". Each worker process holds its own copy, loaded
+    # along with a `version` of the data it was loaded from.
+
+    def __init__(self):
+        self._keys = []
+        self._names = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._checked = None
+        self.loaded = False
+        self.version = None
+
+    @staticmethod
+    def _normalize(text):
+        return (text or '').casefold().strip()
+
+    def _entries(self, item_id, name):
+        name = self._normalize(name)
+        starts = [0] + [m.end() for m in re.finditer(r'\W+', name) if m.end() < len(name)]
+        return sorted(set((name[start:], item_id) for start in starts))
+
+    def load(self, items, version=None):
+        keys = []
+        names = {}
+        for item_id, name in items:
+            names[item_id] = name
+            keys.extend(self._entries(item_id, name))
+        keys.sort()
+        with self._lock:
+            self._keys = keys
+            self._names = names
+            self.loaded = True
+            self.version = version
+            self._checked = time.monotonic()
+
+    def due(self, interval):
+        # Whether to compare `version` with the data now. Until the index is
+        # loaded every caller waits for its turn; after that one caller at
+        # a time gets True once per `interval` seconds while the others keep
+        # completing from the current copy. A caller that gets True must
+        # call checked() when done.
+        if self.loaded and time.monotonic() - self._checked < interval:
+            return False
+        if not self._reload_lock.acquire(blocking=not self.loaded):
+            return False
+        if self.loaded and time.monotonic() - self._checked < interval:
+            self._reload_lock.release()
+            return False
+        return True
+
+    def checked(self):
+        self._checked = time.monotonic()
+        self._reload_lock.release()
+
+    def add(self, item_id, name):
+        with self._lock:
+            self._discard(item_id)
+            self._names[item_id] = name
+            for entry in self._entries(item_id, name):
+                insort(self._keys, entry)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._discard(item_id)
+
+    def _discard(self, item_id):
+        name = self._names.pop(item_id, None)
+        if name is None:
+            return
+        for entry in self._entries(item_id, name):
+            i = bisect_left(self._keys, entry)
+            if i < len(self._keys) and self._keys[i] == entry:
+                del self._keys[i]
+
+    def complete(self, prefix, limit=10):
+        prefix = self._normalize(prefix)
+        if not prefix:
+            return []
+
+        matches = []
+        seen = set()
+        with self._lock:
+            i = bisect_left(self._keys, (prefix,))
+            while i < len(self._keys) and len(matches) < limit:
+                key, item_id = self._keys[i]
+                if not key.startswith(prefix):
+                    break
+                if item_id not in seen:
+                    seen.add(item_id)
+                    matches.append({'id': item_id, 'name': self._names[item_id]})
+                i += 1
+        return matches
@@ -0,0 +1,13 @@
+# ----------------------------------------------------------------------------#
+# Production entrypoint.
+#
+#     gunicorn wsgi:app
+#
+# Server settings, and the hooks that warm the app up before forking and
+# keep database connections out of the forked workers, are in
+# gunicorn.conf.py.
+# ----------------------------------------------------------------------------#
+
+from app import create_app
+
+app = create_app(production=True)